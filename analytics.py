@@ -0,0 +1,42 @@
+# Imports
+from collections import namedtuple
+
+import numpy as np
+
+# Humidity Statistics
+HumidityStats = namedtuple('HumidityStats', ['count', 'per_75', 'high', 'clusters',
+                                             'hist_counts', 'hist_edges',
+                                             'all_std', 'count_high', 'high_std'])
+
+
+def humidity_stats(avg_humidity, std_temp, labels, bins = 'auto'):
+    '''Everything the humidity figures and writeup need, computed in one pass.
+
+    ``high`` is a boolean mask of days at or above the 75th percentile of
+    average humidity and ``clusters`` maps each cluster label to the row
+    indices in it, so callers can slice their columns without refiltering.
+    '''
+    avg_humidity = np.asarray(avg_humidity, dtype = 'float64')
+    std_temp = np.asarray(std_temp, dtype = 'float64')
+    labels = np.asarray(labels)
+
+    ### Percentile split, same linear interpolation and NaN handling as pandas
+    per_75 = np.nanquantile(avg_humidity, .75)
+    high = avg_humidity >= per_75
+
+    ### Row indices per cluster from a single stable sort
+    order = np.argsort(labels, kind = 'stable')
+    ids, starts = np.unique(labels[order], return_index = True)
+    clusters = dict(zip(ids.tolist(), np.split(order, starts[1:])))
+
+    hist_counts, hist_edges = np.histogram(avg_humidity[~np.isnan(avg_humidity)], bins = bins)
+
+    return HumidityStats(count = len(avg_humidity),
+                         per_75 = per_75,
+                         high = high,
+                         clusters = clusters,
+                         hist_counts = hist_counts,
+                         hist_edges = hist_edges,
+                         all_std = np.nanmean(std_temp),
+                         count_high = int(high.sum()),
+                         high_std = np.nanmean(std_temp[high]) if high.any() else np.nan)
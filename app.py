@@ -1,34 +1,99 @@
 # Imports
+## Startup timing, set STARTUP_REPORT=1 to see it
+import startup
+startup.track_imports()
+
 ## Dash and Plotly
 import dash
 from dash import html, dcc
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State, ClientsideFunction
+from dash.exceptions import PreventUpdate
 import plotly.graph_objects as go
 import dash_bootstrap_components as dbc
 
-## Clustering
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-
 ## Helpers
 import queries
+import db
+from snapshot import SnapshotCache
+from store import TimeSeriesStore
+from rollups import RollupEngine
+from pyramid import RollupPyramid
+from clustering import ClusterModel
+from figures import FigureCache, serialize, PLOTLY_JS
+from live import VersionBroadcaster
+from analytics import humidity_stats
+import ingest
+import metrics
+from metrics import instrument, callback_seconds, figure_seconds
 #from config import pgs
 
 ## Standard
 from datetime import datetime
-from sqlalchemy import create_engine
-import pandas as pd
 import os
+import sys
+from flask import Response
+from flask_compress import Compress
 
 # Get Data
-pgs = os.environ['pgs']
-engine = create_engine(pgs)
+## Readings are loaded once, shared between workers through a memory-mapped snapshot, and topped up with only the new rows
+store = TimeSeriesStore(snapshot = 'temp_log')
+
+## Daily aggregates and records are folded in as each batch of readings arrives
+rollups = RollupEngine()
+store.subscribe(rollups.extend, reset = rollups.reset)
+
+## Hourly, daily and weekly tiers for answering zoomed range requests
+pyramid = RollupPyramid(store)
+
+## Humidity clusters are refit in a background process only when new days arrive
+cluster_model = ClusterModel(on_fit = lambda version: announce_humidity(version))
+
+## New readings and the humidity table's version come back in one round trip, except on a cold load
+humidity_seen = []
+
+def refresh_temp_log():
+    statement, params = store.next_query()
+    requests = {'hum_version': (queries.hum_version, {})}
+    if statement is queries.readings:
+        ### The full table is too big to wrap in json_agg, so a cold load reads it as a plain result set
+        frames = dict(db.read_batch(requests), readings = db.read(statement, parse_dates = 'date'))
+    else:
+        requests['readings'] = (statement, params)
+        frames = db.read_batch(requests, parse_dates = {'readings': 'date'})
+
+    ### Humidity rows only change once a day, refetch them as soon as they do
+    hum_version = frames['hum_version'].astype(str).values.tolist()
+    if humidity_seen and humidity_seen[-1] != hum_version:
+        snapshot.invalidate('hum_cluster')
+    humidity_seen[:] = [hum_version]
+
+    return store.apply(frames['readings'])
+
+## One shared snapshot per dataset, refreshed at most once per TTL for all clients
+snapshot = SnapshotCache({
+    'temp_log': refresh_temp_log,
+    'hum_cluster': lambda: db.read(queries.hum_cluster, parse_dates = 'date')})
+
+### Datasets derived from the store are rebuilt whenever temp_log has been refreshed
+for name, derive in [('current_temp', store.current_temp), ('daily', rollups.daily), ('daily_hl', rollups.daily_hl),
+                     ('weekly', store.weekly), ('low', rollups.record_low), ('high', rollups.record_high)]:
+    snapshot.register(name, derive, depends = ['temp_log'])
+
+## Built figures are kept per data version, so unchanged refreshes cost nothing
+figure_cache = FigureCache()
 
 # Application
-app = dash.Dash(external_stylesheets = [dbc.themes.DARKLY])
+app = dash.Dash(external_stylesheets = [dbc.themes.DARKLY], external_scripts = [PLOTLY_JS])
 app.title = "Dustin's Temperature Dashboard"
 server = app.server
 
+## Latency, row and payload histograms on /metrics
+metrics.init_app(server)
+
+## Brotli for browsers that accept it, gzip otherwise, registered last so /metrics sees the compressed size
+server.config.update(COMPRESS_ALGORITHM = ['br', 'gzip'], COMPRESS_BR_LEVEL = 5)
+Compress(server)
+
 # Navbar
 navbar = dbc.NavbarSimple(
     children=[
@@ -64,7 +129,7 @@ app.layout = html.Div([
                             html.H5(id = 'current-temp'),
                             html.P("Welcome to Dustin's Temperature Dashboard! Click the tabs below to view customized, interactive visualizations of the temperature outside " +
                                    "of Dustin's house in Columbus, Ohio. This dashboard was created with Python, SQL, Git, and a few other languages. Links to the source code " +
-                                   "and data are available in the upper right-hand corner. The dashboard will refresh every 5 minutes to fetch the latest data.")]),
+                                   "and data are available in the upper right-hand corner. The dashboard checks for new data every minute or two and updates itself when it finds some.")]),
                                    style = {"margin-bottom": "2rem"}),
                     dbc.Row(
                         dbc.Col(
@@ -119,56 +184,174 @@ app.layout = html.Div([
                                                   title = "1 - Current temperature is requested"),
                                 dbc.AccordionItem("The current temperature, once retrieved, is timestamped and written to a PostgreSQL database. The same Python script that makes the API request also writes the temperature to the database hosted on Bit.io.",
                                                   title = "2 - Temperature is stored in database"),
-                                dbc.AccordionItem("Every 5 minutes Heroku refreshes this dashboard to display the latest data for all measurements and visualizations. The dashboard itself is built in Python using Dash and Plotly, all database queries are written in SQL.",
+                                dbc.AccordionItem("Every minute or two the dashboard checks the database for new readings, and updates itself to display the latest data for all measurements and visualizations. The dashboard itself is built in Python using Dash and Plotly, all database queries are written in SQL.",
                                                   title = "3 - Temperature data is queried and displayed in dashboard")]), width = 8), justify = "center", style = {"margin-bottom": "20rem"})]),
-                dcc.Interval(id = 'interval-component', interval = 300 * 1000, n_intervals = 0)])
+                dcc.Interval(id = 'interval-component', interval = 2 * 1000, n_intervals = 0),
+                dcc.Store(id = 'temp-version'),
+                dcc.Store(id = 'humidity-version')])
 
 # Live Updates
 hght = 625
 
+## Zoom Handling
+tier_names = {'raw': 'Reading', 'hourly': 'Hourly Average', 'daily': 'Daily Average', 'weekly': 'Weekly Average'}
+tier_formats = {'raw': '%b %d, %Y %H:%M%p', 'hourly': '%b %d, %Y %H:%M%p', 'daily': '%b %d, %Y', 'weekly': 'Week of %b %d, %Y'}
+
+def visible_range(graph, relayout):
+    ### Pull the zoomed x-axis window out of a graph's relayoutData, if there is one
+    if not relayout:
+        return None, None
+    if 'xaxis.range[0]' in relayout:
+        return relayout['xaxis.range[0]'], relayout['xaxis.range[1]']
+    if 'xaxis.range' in relayout:
+        return tuple(relayout['xaxis.range'][:2])
+
+    ### A relayout that leaves the x-axis alone, e.g. a y-only zoom, keeps the figure already shown
+    triggered = [trigger['prop_id'] for trigger in dash.callback_context.triggered]
+    if triggered == ['{}.relayoutData'.format(graph)] and 'xaxis.autorange' not in relayout:
+        raise PreventUpdate
+    return None, None
+
+def add_slider_context(fig, df, start, end, color):
+    ### A zoomed figure only carries the window, so the unzoomed rows either side keep the rangeslider's whole range
+    for side in (df.loc[df['date'] < start], df.loc[df['date'] > end]):
+        if len(side):
+            fig.add_trace(go.Scatter(x = side['date'], y = side['temp'], line = dict(color = color, width = 1),
+                                     showlegend = False, hoverinfo = 'skip'))
+
+## Data Versions
+def current_versions(refresh = True):
+    ### Look for new readings straight away rather than waiting out the snapshot TTL
+    if refresh:
+        snapshot.invalidate('temp_log')
+    ### Humidity is announced once its clusters are fitted, so browsers only ask for figures that are ready
+    fitted = cluster_model.fit(snapshot.get('hum_cluster'))[0]
+    return {'temp_log': list(snapshot.get('temp_log')), 'humidity': list(fitted)}
+
+def announce_humidity(version):
+    ### A background refit just landed, tell the browsers without waiting for the next poll
+    if broadcaster.versions is not None:
+        broadcaster.publish(dict(broadcaster.versions, humidity = list(version)))
+
+def is_newer(requested, held):
+    ### Versions are [row count, latest timestamp], compared timestamp first
+    return (requested[1], requested[0]) > (held[1], held[0])
+
+def held_temp_version(requested):
+    ### The browser may have heard about readings from another worker, catch up before building from them
+    held = snapshot.get('temp_log')
+    if is_newer(requested, held):
+        snapshot.invalidate('temp_log')
+        held = snapshot.get('temp_log')
+    return held
+
+def held_humidity(requested):
+    df_hum = snapshot.get('hum_cluster')
+    if is_newer(requested, ClusterModel.version(df_hum)):
+        snapshot.invalidate('hum_cluster')
+        df_hum = snapshot.get('hum_cluster')
+    return df_hum
+
+broadcaster = VersionBroadcaster(current_versions)
+
+@server.route('/events')
+def events():
+    broadcaster.start()
+    return Response(broadcaster.stream(), mimetype = 'text/event-stream',
+                    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+## Bulk Ingest
+def ingested(df):
+    ### Rows newer than any held are appended in place, older ones are left for one reload at the end of the upload
+    if not len(store):
+        snapshot.invalidate('temp_log')
+        return False
+
+    backfilled = df['date'].iloc[0] <= store.last_seen
+    snapshot.put('temp_log', store.apply(df))
+    broadcaster.publish(current_versions(refresh = False))
+    return backfilled
+
+def backfilled():
+    ### Every worker reloads the table once, on its next refresh rather than inside this request
+    store.discard()
+    snapshot.invalidate('temp_log')
+
+ingest.init_app(server, ingested, backfilled)
+
+### The interval only checks the pushed versions in the browser, it never calls the server
+app.clientside_callback(ClientsideFunction(namespace = 'live', function_name = 'pull_versions'),
+                        Output('temp-version', 'data'),
+                        Output('humidity-version', 'data'),
+                        Input('interval-component', 'n_intervals'),
+                        State('temp-version', 'data'),
+                        State('humidity-version', 'data'))
+
 ## Daily Average Figure
-@app.callback(Output('daily-figure', 'figure'),
-              Input('interval-component', 'n_intervals'))
-def update_daily_averages(n):
-    ### Collect data
-    df_daily = pd.read_sql(queries.daily, con = engine, parse_dates = 'date').sort_values('date')
+@instrument(figure_seconds)
+def build_daily_figure(start = None, end = None):
+    ### Collect data for the visible window from the coarsest tier that still fills the graph
+    snapshot.get('temp_log')
+    tier, df_daily = pyramid.query(start, end)
+
+    df_sma = snapshot.get('daily')
+    if len(df_daily):
+        df_sma = df_sma.loc[(df_sma.date >= df_daily.date.iloc[0].floor('D')) & (df_sma.date <= df_daily.date.iloc[-1])]
+    if tier == 'weekly':
+        df_sma = df_sma.iloc[::7]
 
     ### Build figure
     daily_fig = go.Figure()
     daily_fig.add_trace(go.Scatter(x = df_daily['date'], y = df_daily['temp'],
-                                   name = "Daily Average",
+                                   name = tier_names[tier],
                                    line=dict(color='rgba(247,168,1,0.65)', width=1),
-                                   text = [item.strftime('%b %d, %Y') for item in df_daily['date']],
-                                   hovertemplate = '''Date: %{text}<br>Avg: %{y:.2f}°F<extra></extra>'''))
+                                   hovertemplate = '''Date: %{x|''' + tier_formats[tier] + '''}<br>Avg: %{y:.2f}°F<extra></extra>'''))
 
-    daily_fig.add_trace(go.Scatter(x = df_daily['date'], y = df_daily['moving_avg'],
+    daily_fig.add_trace(go.Scatter(x = df_sma['date'], y = df_sma['moving_avg'],
                                    name = "10-Day SMA",
                                    line=dict(color='rgba(56,250,251,1)', width=4),
-                                   text = [item.strftime('%b %d, %Y') for item in df_daily['date']],
-                                   hovertemplate = '''Date: %{text}<br>Avg: %{y:.2f}°F<extra></extra>'''))
+                                   hovertemplate = '''Date: %{x|%b %d, %Y}<br>Avg: %{y:.2f}°F<extra></extra>'''))
 
     daily_fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font_color='white',
                             showlegend = True, title_text = 'Average Daily Temperature',
                             xaxis=dict(rangeslider=dict(visible = True), type = "date", showgrid = False),
                             yaxis=dict(gridcolor = '#444444'),
                             yaxis_title = "Temperature in °F",
-                            height = hght)
+                            height = hght,
+                            uirevision = 'daily')
+    if start is not None:
+        add_slider_context(daily_fig, pyramid.query()[1], start, end, 'rgba(247,168,1,0.3)')
+        daily_fig.update_xaxes(range = [start, end])
 
     return daily_fig
 
+@app.callback(Output('daily-figure', 'figure'),
+              Input('temp-version', 'data'),
+              Input('daily-figure', 'relayoutData'))
+@instrument(callback_seconds)
+def update_daily_averages(version, relayout):
+    if version is None:
+        raise PreventUpdate
+
+    ### Cached figures are keyed on the data this worker holds, not the version the browser sent
+    version = held_temp_version(version)
+    start, end = visible_range('daily-figure', relayout)
+    if start is None:
+        return figure_cache.get('daily', version, build_daily_figure)
+    return serialize(build_daily_figure(start, end))
+
 ## Daily High Low Figure
-@app.callback(Output('high-low-figure', 'figure'),
-              Input('interval-component', 'n_intervals'))
-def update_daily_high_low(n):
+@instrument(figure_seconds)
+def build_high_low_figure():
     ### Collect Data
-    df_hl = pd.read_sql(queries.daily_hl, con = engine)
+    df_hl = snapshot.get('daily_hl')
 
     ### Build figure
     hl_fig = go.Figure()
     hl_fig.add_trace(go.Scatter(x = df_hl['min'], y = df_hl['max'], mode = "markers",
                                 marker=dict(color='rgba(56,250,251,1)'),
-                                text = [item.strftime('%b %d, %Y') for item in df_hl['date']],
-                                hovertemplate = '''Date: %{text}<br>Max: %{y:.2f}°F<br>Min: %{x:.2f}°F<extra></extra>'''))
+                                customdata = df_hl['date'].to_numpy(dtype = 'datetime64[D]'),
+                                hovertemplate = '''Date: %{customdata|%b %d, %Y}<br>Max: %{y:.2f}°F<br>Min: %{x:.2f}°F<extra></extra>'''))
 
     hl_fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font_color='white',
                             showlegend = False, title_text = 'Daily Highs and Lows',
@@ -180,12 +363,24 @@ def update_daily_high_low(n):
 
     return hl_fig
 
+@app.callback(Output('high-low-figure', 'figure'),
+              Input('temp-version', 'data'))
+@instrument(callback_seconds)
+def update_daily_high_low(version):
+    if version is None:
+        raise PreventUpdate
+
+    return figure_cache.get('high_low', held_temp_version(version), build_high_low_figure)
+
 ## Last Week Figure
-@app.callback(Output('weekly-figure', 'figure'),
-              Input('interval-component', 'n_intervals'))
-def update_weekly(n):
+@instrument(figure_seconds)
+def build_weekly_figure(start = None, end = None):
     ### Collect Data
-    df_wk = pd.read_sql(queries.weekly, con = engine)
+    df_wk = snapshot.get('weekly')
+    if start is not None:
+        tier, df_view = pyramid.query(start, end)
+    else:
+        tier, df_view = 'raw', df_wk
 
     ### Low
     low = df_wk.loc[df_wk.temp == df_wk.temp.min()]
@@ -195,46 +390,71 @@ def update_weekly(n):
 
     ### Build Figure
     wk_fig = go.Figure()
-    wk_fig.add_trace(go.Scatter(x = df_wk['date'], y = df_wk['temp'],
+    wk_fig.add_trace(go.Scatter(x = df_view['date'], y = df_view['temp'],
                                    line=dict(color='rgba(56,250,251,1)', width=2),
-                                   text = [item.strftime('%b %d, %Y %H:%M%p') for item in df_wk['date']],
-                                   hovertemplate = '''Date and Time: %{text}<br>Temp: %{y:.2f}°F<extra></extra>'''))
+                                   hovertemplate = '''Date and Time: %{x|''' + tier_formats[tier] + '''}<br>Temp: %{y:.2f}°F<extra></extra>'''))
 
     wk_fig.add_trace(go.Scatter(x = low['date'], y = low['temp'], mode = "markers",
                                    marker=dict(color='rgba(52,152,219,1)', size = 25, symbol = 'arrow-down'),
-                                   text = [item.strftime('%b %d, %Y %H:%M%p') for item in low['date']],
-                                   hovertemplate = '''<b>Weekly Low</b><br>Date and Time: %{text}<br>Temp: %{y:.2f}°F<extra></extra>'''))
+                                   hovertemplate = '''<b>Weekly Low</b><br>Date and Time: %{x|%b %d, %Y %H:%M%p}<br>Temp: %{y:.2f}°F<extra></extra>'''))
 
     wk_fig.add_trace(go.Scatter(x = high['date'], y = high['temp'], mode = "markers",
                                    marker=dict(color='rgba(231,76,60,1)', size = 25, symbol = 'arrow-up'),
-                                   text = [item.strftime('%b %d, %Y %H:%M%p') for item in high['date']],
-                                   hovertemplate = '''<b>Weekly High</b><br>Date and Time: %{text}<br>Temp: %{y:.2f}°F<extra></extra>'''))
+                                   hovertemplate = '''<b>Weekly High</b><br>Date and Time: %{x|%b %d, %Y %H:%M%p}<br>Temp: %{y:.2f}°F<extra></extra>'''))
 
     wk_fig.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font_color='white',
                             showlegend = False, title_text = 'Last Seven Days',
                             xaxis=dict(rangeslider=dict(visible = True), type = "date", showgrid = False),
                             yaxis=dict(gridcolor = '#444444'),
                             height = hght,
-                            yaxis_title = "Temperature in °F")
+                            yaxis_title = "Temperature in °F",
+                            uirevision = 'weekly')
+    if start is not None:
+        add_slider_context(wk_fig, df_wk, start, end, 'rgba(56,250,251,0.3)')
+        wk_fig.update_xaxes(range = [start, end])
 
     return wk_fig
 
+@app.callback(Output('weekly-figure', 'figure'),
+              Input('temp-version', 'data'),
+              Input('weekly-figure', 'relayoutData'))
+@instrument(callback_seconds)
+def update_weekly(version, relayout):
+    if version is None:
+        raise PreventUpdate
+
+    version = held_temp_version(version)
+    start, end = visible_range('weekly-figure', relayout)
+    if start is None:
+        return figure_cache.get('weekly', version, build_weekly_figure)
+    return serialize(build_weekly_figure(start, end))
+
 ## Current Temperature
 @app.callback(Output('current-temp', 'children'),
-              Input('interval-component', 'n_intervals'))
-def update_current_temp(n):
+              Input('temp-version', 'data'))
+@instrument(callback_seconds)
+def update_current_temp(version):
+    if version is None:
+        raise PreventUpdate
+    held_temp_version(version)
+
     ### Get Data
-    cur_temp = pd.read_sql(queries.current_temp, con = engine, parse_dates = 'date')['temp'][0]
+    cur_temp = snapshot.get('current_temp')['temp'][0]
 
     return "The Current Temperature at Dustin's House is {0:.1f}°F".format(cur_temp)
 
 ## Record Low
 @app.callback(Output('low-temp', 'children'),
               Output('low-temp-date', 'children'),
-              Input('interval-component', 'n_intervals'))
-def update_record_low(n):
+              Input('temp-version', 'data'))
+@instrument(callback_seconds)
+def update_record_low(version):
+    if version is None:
+        raise PreventUpdate
+    held_temp_version(version)
+
     ### Get Data
-    record_low = pd.read_sql(queries.low, con = engine)
+    record_low = snapshot.get('low')
 
     ### Transform
     rl_temp = "{0:.1f}°F".format(record_low['temp'][0])
@@ -245,10 +465,15 @@ def update_record_low(n):
 ## Record High
 @app.callback(Output('high-temp', 'children'),
               Output('high-temp-date', 'children'),
-              Input('interval-component', 'n_intervals'))
-def update_record_high(n):
+              Input('temp-version', 'data'))
+@instrument(callback_seconds)
+def update_record_high(version):
+    if version is None:
+        raise PreventUpdate
+    held_temp_version(version)
+
     ### Get Data
-    record_high = pd.read_sql(queries.high, con = engine)
+    record_high = snapshot.get('high')
 
     ### Transform
     rh_temp = "{0:.1f}°F".format(record_high['temp'][0])
@@ -257,31 +482,27 @@ def update_record_high(n):
     return rh_temp, rh_date
 
 ## Humidity Testing
-@app.callback(Output('hum-cluster-figure', 'figure'),
-              Output('hum-hist-figure', 'figure'),
-              Output('hum-comp-figure', 'figure'),
-              Output('writeup', 'children'),
-              Input('interval-component', 'n_intervals'))
-def update_hum_tests(n):
+@instrument(figure_seconds)
+def build_humidity_figures(df, labels):
     ### Get Data
-    df = (pd.read_sql(queries.hum_cluster, con = engine, parse_dates = 'date')
-            .assign(ah_scaled = lambda x: StandardScaler().fit_transform(x.avg_humidity.array.reshape(-1,1)),
-                    st_scaled = lambda x: StandardScaler().fit_transform(x.std_temp.array.reshape(-1,1)),
-                    cluster = lambda x: KMeans(3).fit_predict(x[['ah_scaled','st_scaled']])))
+    avg_humidity = df['avg_humidity'].to_numpy(dtype = 'float64')
+    std_temp = df['std_temp'].to_numpy(dtype = 'float64')
+    ### Day resolution is enough, and serializes as a short date string that hover labels can format
+    dates = df['date'].to_numpy(dtype = 'datetime64[D]')
+    stats = humidity_stats(avg_humidity, std_temp, labels)
 
     ### Clustering
-    clusters = df.cluster.sort_values().unique()
     colors = ['rgba(56,250,251,1)', 'rgba(247,168,1,1)','rgba(0,255,117,1)']
-    hovertemp = '''Date: %{text}<br>Avg Humidity: %{x:.2f}%<br>Std Dev of Temp: %{y:.2f}°F<extra></extra>'''
+    hovertemp = '''Date: %{customdata|%b %d, %Y}<br>Avg Humidity: %{x:.2f}%<br>Std Dev of Temp: %{y:.2f}°F<extra></extra>'''
 
     hum_fig = go.Figure()
 
-    for cluster in clusters:
-        hum_fig.add_trace(go.Scatter(x = df.loc[df.cluster == cluster]['avg_humidity'],
-                                     y = df.loc[df.cluster == cluster]['std_temp'],
+    for cluster, rows in stats.clusters.items():
+        hum_fig.add_trace(go.Scatter(x = avg_humidity[rows],
+                                     y = std_temp[rows],
                                      mode = "markers",
                                      name = str('Cluster '+ str(cluster)),
-                                     text = [item.strftime('%b %d, %Y') for item in df.loc[df.cluster == cluster]['date']],
+                                     customdata = dates[rows],
                                      hovertemplate = hovertemp,
                                      marker = {'color': colors[cluster]}))
 
@@ -296,32 +517,32 @@ def update_hum_tests(n):
     ### Histogram
     hum_hist = go.Figure()
 
-    hum_hist.add_trace(go.Histogram(x = df.avg_humidity, marker_color = 'rgba(56,250,251,0.75)'))
+    hum_hist.add_trace(go.Bar(x = (stats.hist_edges[:-1] + stats.hist_edges[1:]) / 2, y = stats.hist_counts,
+                              width = stats.hist_edges[1:] - stats.hist_edges[:-1],
+                              marker_color = 'rgba(56,250,251,0.75)',
+                              hovertemplate = '''Avg Humidity: %{x:.1f}%<br>Days: %{y}<extra></extra>'''))
 
     hum_hist.update_layout(paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font_color='white',
                            title_text = 'Distibution of Average Humidity', yaxis_title = "Count of Days",
                            xaxis_title = "Average Humidity in %", yaxis = dict(gridcolor = '#444444'),
-                           height = hght,
+                           height = hght, bargap = 0,
                            xaxis = dict(gridcolor = '#444444'))
 
-    hum_hist.add_vline(x = df.avg_humidity.quantile(.75), line_width = 4, line_dash = "dot",
+    hum_hist.add_vline(x = stats.per_75, line_width = 4, line_dash = "dot",
                        line_color = 'rgba(247,168,1,1)',
-                       annotation_text = '75th Percentile = '+ str(df.avg_humidity.quantile(.75)))
+                       annotation_text = '75th Percentile = '+ str(stats.per_75))
 
     ### Violin
     test_fig = go.Figure()
 
-    df_test = df.assign(high = lambda x: ['High Humidity Days' if item >= x.avg_humidity.quantile(.75) else 'Normal' for item in x.avg_humidity],
-                        normal = 'All Days')
-
-    test_fig.add_trace(go.Violin(x = df_test.normal, y = df_test.std_temp,
+    test_fig.add_trace(go.Violin(x0 = 'All Days', y = std_temp,
                                  name = 'All Days', box_visible = True,
                                  meanline_visible = True,
                                  line_color = 'rgba(56,250,251,1)',
                                  points = 'all'))
 
-    test_fig.add_trace(go.Violin(x = df_test.loc[df_test.high == 'High Humidity Days']['high'],
-                                 y = df_test.loc[df_test.high == 'High Humidity Days']['std_temp'],
+    test_fig.add_trace(go.Violin(x0 = 'High Humidity Days',
+                                 y = std_temp[stats.high],
                                  name = 'High Humidity Days', box_visible = True,
                                  meanline_visible = True,
                                  line_color = 'rgba(247,168,1,1)',
@@ -335,17 +556,59 @@ def update_hum_tests(n):
                            xaxis = dict(showgrid = False))
 
     ### writeup
-    count = len(df_test)
-    all_std = df_test.std_temp.mean()
-    per_75 = df_test.avg_humidity.quantile(.75)
-    count_high = len(df_test.loc[df_test.high == "High Humidity Days"])
-    high_std = df_test.loc[df_test.high == "High Humidity Days"]['std_temp'].mean()
-
-    writeup_text = (f'''There are currently {count} days with humidity data in the dataset, the average standard deviation of the temperature for those days is {all_std:.2f}°F''' +
-                    f''', and the 75th percentile of the humidity percentage is {per_75:.2f}%. There are {count_high} days with an average humidity at or above''' +
-                    f''' the 75th percentile, having an average standard deviation of the temperature of {high_std:.2f}°F.''')
+    writeup_text = (f'''There are currently {stats.count} days with humidity data in the dataset, the average standard deviation of the temperature for those days is {stats.all_std:.2f}°F''' +
+                    f''', and the 75th percentile of the humidity percentage is {stats.per_75:.2f}%. There are {stats.count_high} days with an average humidity at or above''' +
+                    f''' the 75th percentile, having an average standard deviation of the temperature of {stats.high_std:.2f}°F.''')
 
     return hum_fig, hum_hist, test_fig, writeup_text
 
+@app.callback(Output('hum-cluster-figure', 'figure'),
+              Output('hum-hist-figure', 'figure'),
+              Output('hum-comp-figure', 'figure'),
+              Output('writeup', 'children'),
+              Input('humidity-version', 'data'))
+@instrument(callback_seconds)
+def update_hum_tests(version):
+    if version is None:
+        raise PreventUpdate
+
+    ### Keyed on the version the clusters were fitted to, which lags the data while a refit runs
+    fitted, df, labels = cluster_model.fit(held_humidity(version))
+    return figure_cache.get('humidity', fitted, lambda: build_humidity_figures(df, labels))
+
+# Warm Up
+def warm():
+    ### Fill the data and figure caches, e.g. in the gunicorn master so forked workers inherit them
+    try:
+        fill_caches()
+    except Exception as error:
+        ### A database blip at deploy time shouldn't stop the master booting, workers load lazily instead
+        print('Warm-up failed, caches will fill on first request: {!r}'.format(error), file = sys.stderr, flush = True)
+        figure_cache.clear()
+        snapshot.invalidate()
+    finally:
+        ### Nothing that can't cross a fork is left open
+        cluster_model.shutdown()
+        db.release()
+
+def fill_caches():
+    with startup.step('warm data'):
+        db.concurrently(lambda: snapshot.get('temp_log'), lambda: snapshot.get('hum_cluster'))
+        versions = current_versions()
+
+    with startup.step('warm figures'):
+        figure_cache.get('daily', versions['temp_log'], build_daily_figure)
+        figure_cache.get('high_low', versions['temp_log'], build_high_low_figure)
+        figure_cache.get('weekly', versions['temp_log'], build_weekly_figure)
+
+    with startup.step('warm humidity'):
+        fitted, df, labels = cluster_model.fit(snapshot.get('hum_cluster'))
+        figure_cache.get('humidity', fitted, lambda: build_humidity_figures(df, labels))
+
+if os.environ.get('WARM_ON_IMPORT', '') not in ('', '0'):
+    warm()
+
+startup.report()
+
 if __name__ == '__main__':
    app.run_server(debug=True)
@@ -0,0 +1,28 @@
+// Live updates: the server pushes a new data version over server-sent events,
+// and a clientside callback copies it into the version stores only when it changed.
+window.dustinsHouse = {versions: null};
+
+(function () {
+    var source = new EventSource('/events');
+    source.addEventListener('version', function (event) {
+        window.dustinsHouse.versions = JSON.parse(event.data);
+    });
+})();
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    live: {
+        pull_versions: function (n, tempVersion, humidityVersion) {
+            var noUpdate = window.dash_clientside.no_update;
+            var versions = window.dustinsHouse.versions;
+            if (!versions) {
+                return [noUpdate, noUpdate];
+            }
+
+            var changed = function (next, current) {
+                return JSON.stringify(next) !== JSON.stringify(current);
+            };
+            return [changed(versions.temp_log, tempVersion) ? versions.temp_log : noUpdate,
+                    changed(versions.humidity, humidityVersion) ? versions.humidity : noUpdate];
+        }
+    }
+});
@@ -0,0 +1,239 @@
+'''Benchmark the dashboard's queries and callbacks against synthetic data.
+
+Each scenario generates a synthetic ``temp_log`` and ``humidity-temps`` into a
+local SQLite stand-in for the Postgres database, then runs in its own process
+so peak memory and cold caches are measured per dataset size:
+
+    python bench.py                          # 1, 5 and 20 years of 15 minute readings, 1 year of 1 minute readings
+    python bench.py --years 5 --minutes 15   # a single scenario
+    python bench.py --compare bench_results/old.json
+
+Results are written as JSON to ``bench_results/`` so runs can be compared.
+'''
+
+# Imports
+import argparse
+import gzip
+import json
+import math
+import os
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+SCHEMA = 'dkelly-proj/cbus_temps'
+DEFAULT_SCENARIOS = [(1, 15), (5, 15), (20, 15), (1, 1)]
+QUERY_PARAMS = {'readings_since': lambda dates: {'last_seen': dates[len(dates) * 9 // 10]},
+                'readings_between': lambda dates: {'start': dates[len(dates) // 2], 'end': dates[len(dates) // 2 + 672]},
+                'weekly': lambda dates: {'start': dates[-672]}}
+
+
+# Synthetic Data
+def generate(years, minutes, seed = 0):
+    '''Readings with seasonal, diurnal and weather-like noise components, plus daily humidity.'''
+    rng = np.random.default_rng(seed)
+    step = np.timedelta64(minutes, 'm')
+    now = np.datetime64(datetime.now(), 'm')
+    end = now - (now - now.astype('datetime64[D]')) % step
+    count = int(years * 365.25 * 24 * 60 / minutes)
+    dates = end - step * np.arange(count, 0, -1)
+
+    day_of_year = (dates - dates.astype('datetime64[Y]')).astype('timedelta64[m]').astype('float64') / (24 * 60)
+    hour = (dates - dates.astype('datetime64[D]')).astype('timedelta64[m]').astype('float64') / 60
+
+    ### Warmest in late July, coldest in late January, and warmest mid afternoon
+    seasonal = 52 + 22 * np.sin(2 * math.pi * (day_of_year - 110) / 365.25)
+    diurnal = 8 * np.sin(2 * math.pi * (hour - 9) / 24)
+
+    ### Slow moving weather fronts plus sensor noise
+    steps_per_day = 24 * 60 / minutes
+    front_days = np.repeat(rng.normal(0, 6, int(math.ceil(count / steps_per_day)) + 1), int(steps_per_day))[:count]
+    fronts = np.convolve(front_days, np.ones(int(steps_per_day)) / steps_per_day, mode = 'same')
+    temps = np.round(seasonal + diurnal + fronts + rng.normal(0, 1.5, count), 2)
+
+    ### One humidity row per day, damper days swinging less
+    days, starts = np.unique(dates.astype('datetime64[D]'), return_index = True)
+    std_temp = np.array([chunk.std(ddof = 1) if len(chunk) > 1 else 0.0 for chunk in np.split(temps, starts[1:])])
+    avg_humidity = np.clip(95 - 3.5 * std_temp + rng.normal(0, 8, len(days)), 20, 100)
+
+    return dates, temps, days, avg_humidity, std_temp
+
+
+def write_sqlite(path, dates, temps, days, avg_humidity, std_temp):
+    con = sqlite3.connect(path)
+    con.execute('CREATE TABLE temp_log (date TEXT, temp REAL)')
+    con.execute('CREATE INDEX temp_log_date ON temp_log (date)')
+    con.execute('CREATE TABLE "humidity-temps" (date TEXT, avg_humidity REAL, std_temp REAL)')
+    con.executemany('INSERT INTO temp_log VALUES (?, ?)',
+                    zip(np.char.replace(np.datetime_as_string(dates, unit = 's'), 'T', ' ').astype(object), temps.tolist()))
+    con.executemany('INSERT INTO "humidity-temps" VALUES (?, ?, ?)',
+                    zip(np.datetime_as_string(days, unit = 'D').astype(object), avg_humidity.tolist(), std_temp.tolist()))
+    con.commit()
+    con.close()
+
+
+def sqlite_stand_in(data_path):
+    '''Make a SQLite connection look enough like the Postgres database for queries.py.'''
+    def date_trunc(unit, value):
+        return value[:10] + ' 00:00:00' if unit == 'day' else value
+
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.execute('ATTACH DATABASE ? AS "{}"'.format(SCHEMA), (data_path,))
+        dbapi_connection.create_function('date_trunc', 2, date_trunc)
+
+    return on_connect
+
+
+# Measurement
+def measure(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timings = np.array(timings) * 1000
+    return result, {'p50_ms': float(np.percentile(timings, 50)),
+                    'p95_ms': float(np.percentile(timings, 95)),
+                    'p99_ms': float(np.percentile(timings, 99)),
+                    'max_ms': float(timings.max()),
+                    'peak_alloc_bytes': peak}
+
+
+def run_scenario(years, minutes, repeat):
+    workdir = tempfile.mkdtemp(prefix = 'dustins-house-bench-')
+    data_path = os.path.join(workdir, 'cbus_temps.db')
+
+    start = time.perf_counter()
+    dates, temps, days, avg_humidity, std_temp = generate(years, minutes)
+    write_sqlite(data_path, dates, temps, days, avg_humidity, std_temp)
+    generate_seconds = time.perf_counter() - start
+
+    os.environ['pgs'] = 'sqlite:///' + os.path.join(workdir, 'main.db')
+    ### Keep the memory-mapped snapshot private to this scenario, away from earlier runs and the real app
+    os.environ['SNAPSHOT_DIR'] = os.path.join(workdir, 'snapshots')
+    import brotli
+    from plotly.utils import PlotlyJSONEncoder
+    from sqlalchemy import event
+    import queries
+    import db
+    import app
+
+    event.listen(db.get_engine(), 'connect', sqlite_stand_in(data_path))
+    date_strings = np.char.replace(np.datetime_as_string(dates, unit = 's'), 'T', ' ')
+
+    ### Queries
+    query_results = {}
+    for name, statement in queries.STATEMENTS.items():
+        params = QUERY_PARAMS[name](date_strings) if name in QUERY_PARAMS else {}
+        frame, stats = measure(lambda: queries.read(statement, db.get_engine(), **params), repeat)
+        query_results[name] = dict(stats, rows = len(frame))
+
+    ### Callbacks, cold means the figure cache is emptied before every call
+    start = time.perf_counter()
+    versions = app.current_versions()
+    warm_seconds = time.perf_counter() - start
+
+    temp_version, humidity_version = versions['temp_log'], versions['humidity']
+    callbacks = {'update_daily_averages': (temp_version, None),
+                 'update_daily_high_low': (temp_version,),
+                 'update_weekly': (temp_version, None),
+                 'update_current_temp': (temp_version,),
+                 'update_record_low': (temp_version,),
+                 'update_record_high': (temp_version,),
+                 'update_hum_tests': (humidity_version,)}
+
+    callback_results = {}
+    for name, args in callbacks.items():
+        fn = getattr(getattr(app, name), '__wrapped__', getattr(app, name))
+
+        def cold():
+            app.figure_cache.clear()
+            return fn(*args)
+
+        output, stats = measure(cold, repeat)
+        _, warm = measure(lambda: fn(*args), repeat)
+        payload = json.dumps(output, cls = PlotlyJSONEncoder).encode()
+        callback_results[name] = dict(stats, warm_p50_ms = warm['p50_ms'], payload_bytes = len(payload),
+                                      gzip_bytes = len(gzip.compress(payload)),
+                                      brotli_bytes = len(brotli.compress(payload, quality = 5)))
+
+    return {'years': years, 'minutes': minutes, 'rows': int(len(dates)), 'days': int(len(days)),
+            'generate_seconds': generate_seconds, 'warm_seconds': warm_seconds,
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'queries': query_results, 'callbacks': callback_results}
+
+
+# Reporting
+def compare(old, new):
+    old_runs = {(run['years'], run['minutes']): run for run in old['scenarios']}
+    for run in new['scenarios']:
+        previous = old_runs.get((run['years'], run['minutes']))
+        if previous is None:
+            continue
+        print('{years} years at {minutes} minute readings'.format(**run))
+        for group in ('queries', 'callbacks'):
+            for name, stats in run[group].items():
+                before = previous[group].get(name)
+                if before and before['p50_ms']:
+                    print('  {:<28} p50 {:>9.2f} ms -> {:>9.2f} ms  ({:+.0%})'.format(
+                        name, before['p50_ms'], stats['p50_ms'], stats['p50_ms'] / before['p50_ms'] - 1))
+                if before and before.get('payload_bytes'):
+                    sent = stats.get('brotli_bytes', stats['payload_bytes'])
+                    print('  {:<28} payload {:>9,} B -> {:>9,} B  ({:.1f}x smaller as sent)'.format(
+                        name, before['payload_bytes'], sent, before['payload_bytes'] / max(sent, 1)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--years', type = float, nargs = '+')
+    parser.add_argument('--minutes', type = int, nargs = '+')
+    parser.add_argument('--repeat', type = int, default = 5)
+    parser.add_argument('--output', default = None)
+    parser.add_argument('--compare', default = None)
+    parser.add_argument('--child', default = None, help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        years, minutes = json.loads(args.child)
+        print(json.dumps(run_scenario(years, minutes, args.repeat)))
+        return
+
+    if args.years or args.minutes:
+        scenarios = [(years, minutes) for years in args.years or [1] for minutes in args.minutes or [15]]
+    else:
+        scenarios = DEFAULT_SCENARIOS
+
+    ### Every scenario gets a fresh process so memory and caches don't carry over
+    results = {'timestamp': datetime.now().isoformat(timespec = 'seconds'), 'scenarios': []}
+    for years, minutes in scenarios:
+        print('Running {} years at {} minute readings...'.format(years, minutes), file = sys.stderr)
+        child = subprocess.run([sys.executable, __file__, '--child', json.dumps([years, minutes]), '--repeat', str(args.repeat)],
+                               capture_output = True, text = True, check = True)
+        results['scenarios'].append(json.loads(child.stdout.strip().splitlines()[-1]))
+
+    output = args.output or os.path.join('bench_results', '{}.json'.format(results['timestamp'].replace(':', '')))
+    os.makedirs(os.path.dirname(output) or '.', exist_ok = True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent = 2)
+    print('Saved results to {}'.format(output), file = sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# Imports
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+# Settings
+CLUSTERS = 3
+SEED = int(os.environ.get('CLUSTER_SEED', 42))
+
+
+# Fitting
+def fit_clusters(features, centroids = None, n_clusters = CLUSTERS, seed = SEED):
+    '''Scale ``features`` and run KMeans, returning labels and centroids in original units.
+
+    Runs in a worker process. When ``centroids`` from a previous fit are given
+    the fit is warm-started from them with a single init, which keeps each
+    cluster's ID attached to the same group of days between refits.
+    '''
+    from sklearn.cluster import KMeans
+
+    ### Same scaling as StandardScaler, per column
+    mean = features.mean(axis = 0)
+    std = features.std(axis = 0)
+    std[std == 0] = 1
+    scaled = (features - mean) / std
+
+    if centroids is None:
+        model = KMeans(n_clusters, n_init = 10, random_state = seed).fit(scaled)
+        ### Number cold-start clusters by humidity so the IDs don't depend on init order
+        order = np.argsort(model.cluster_centers_[:, 0])
+        labels = np.argsort(order)[model.labels_]
+        centers = model.cluster_centers_[order]
+    else:
+        model = KMeans(n_clusters, init = (centroids - mean) / std, n_init = 1, random_state = seed).fit(scaled)
+        labels = model.labels_
+        centers = model.cluster_centers_
+
+    return labels, centers * std + mean
+
+
+# Model Cache
+class ClusterModel:
+    '''Humidity clusters cached by ``humidity-temps`` dataset version.
+
+    A new version triggers a warm-started refit in a background process. Until
+    it lands, callers get the last fitted version, frame and labels, so a
+    refit never holds up a request. Only the very first fit is waited on.
+    ``on_fit(version)`` is called whenever a fit lands.
+    '''
+
+    def __init__(self, columns = ('avg_humidity', 'std_temp'), on_fit = None):
+        self.columns = list(columns)
+        self.on_fit = on_fit
+        self._lock = threading.RLock()
+        self._executor = None
+        self._pid = None
+        self._fitted = None
+        self._centroids = None
+        self._pending = {}
+
+    def fit(self, df):
+        '''Return ``(version, df, labels)`` for the newest fit, which may be older than ``df``.'''
+        version = self.version(df)
+
+        with self._lock:
+            fitted = self._fitted
+            if fitted is not None and fitted[0] == version:
+                return fitted
+
+            future = self._pending.get(version)
+            if future is None:
+                features = df[self.columns].to_numpy(dtype = 'float64')
+                future = self._submit(features, self._centroids)
+                self._pending[version] = future
+                future.add_done_callback(lambda f: self._store(version, df, f))
+
+        if fitted is None:
+            ### Nothing to show yet, so wait for the first fit
+            future.result()
+            self._store(version, df, future)
+            return version, df, future.result()[0]
+
+        return fitted
+
+    @staticmethod
+    def version(df):
+        return (len(df), str(df['date'].max()))
+
+    def _submit(self, features, centroids):
+        ### A pool inherited through a fork has no management thread, so start a fresh one
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ProcessPoolExecutor(max_workers = 1)
+            self._pid = os.getpid()
+        return self._executor.submit(fit_clusters, features, centroids)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown()
+            self._executor = None
+
+    def _store(self, version, df, future):
+        with self._lock:
+            self._pending.pop(version, None)
+            if future.exception() is not None:
+                if isinstance(future.exception(), BrokenProcessPool):
+                    self._executor = None
+                return
+            labels, centroids = future.result()
+            if self._fitted is not None and self._fitted[0] == version:
+                return
+            self._fitted = (version, df, labels)
+            self._centroids = centroids
+
+        if self.on_fit is not None:
+            self.on_fit(version)
@@ -0,0 +1,110 @@
+'''Columnar on-disk snapshots that gunicorn workers memory-map instead of copying.
+
+Each snapshot is a directory of ``.npy`` files, one per column, plus a small
+pointer file naming the current directory. Writers build a new directory and
+swap the pointer atomically, so readers never see a half-written snapshot, and
+workers that already mapped an older one keep reading it until they reopen.
+
+Rows that land before the end of a snapshot can't be appended to it, so the
+snapshot is retired instead: its generation number goes up, and every reader
+that sees the new number reloads from scratch.
+'''
+
+# Imports
+import fcntl
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# Settings
+CACHE_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(tempfile.gettempdir(), 'dustins-house'))
+
+
+def current(name, cache_dir = CACHE_DIR):
+    '''Name of the directory holding the latest snapshot, or None.'''
+    try:
+        with open(os.path.join(cache_dir, name + '.current')) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load(name, cache_dir = CACHE_DIR):
+    '''Memory-map the latest snapshot as ``(tag, {column: array})``, or ``(None, None)``.'''
+    tag = current(name, cache_dir)
+    if tag is None:
+        return None, None
+
+    folder = os.path.join(cache_dir, tag)
+    try:
+        return tag, {file[:-4]: np.load(os.path.join(folder, file), mmap_mode = 'r')
+                     for file in os.listdir(folder) if file.endswith('.npy')}
+    except FileNotFoundError:
+        return None, None
+
+
+def save(name, columns, cache_dir = CACHE_DIR):
+    '''Write ``columns`` as a new snapshot and point readers at it, returning its tag.'''
+    os.makedirs(cache_dir, exist_ok = True)
+    tag = '{}-{}-{}'.format(name, time.time_ns(), os.getpid())
+    building = os.path.join(cache_dir, tag + '.tmp')
+    os.makedirs(building)
+    for column, values in columns.items():
+        np.save(os.path.join(building, column + '.npy'), np.ascontiguousarray(values))
+    os.rename(building, os.path.join(cache_dir, tag))
+
+    previous = current(name, cache_dir)
+    pointer = os.path.join(cache_dir, name + '.current')
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(tag)
+    os.replace(pointer + '.tmp', pointer)
+
+    ### Mapped files stay readable after unlinking, so old snapshots can go straight away
+    if previous is not None:
+        shutil.rmtree(os.path.join(cache_dir, previous), ignore_errors = True)
+    return tag
+
+
+def generation(name, cache_dir = CACHE_DIR):
+    '''How many times ``name`` has been retired, 0 if never.'''
+    try:
+        with open(os.path.join(cache_dir, name + '.generation')) as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def retire(name, cache_dir = CACHE_DIR):
+    '''Drop the current snapshot and bump its generation, returning the new one.'''
+    with writer_lock(name, cache_dir, blocking = True):
+        number = generation(name, cache_dir) + 1
+        counter = os.path.join(cache_dir, name + '.generation')
+        with open(counter + '.tmp', 'w') as f:
+            f.write(str(number))
+        os.replace(counter + '.tmp', counter)
+
+        previous = current(name, cache_dir)
+        if previous is not None:
+            os.remove(os.path.join(cache_dir, name + '.current'))
+            shutil.rmtree(os.path.join(cache_dir, previous), ignore_errors = True)
+        return number
+
+
+@contextmanager
+def writer_lock(name, cache_dir = CACHE_DIR, blocking = False):
+    '''Yield True if this process got the write lock for ``name``, False if another holds it.'''
+    os.makedirs(cache_dir, exist_ok = True)
+    with open(os.path.join(cache_dir, name + '.lock'), 'w') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
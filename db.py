@@ -0,0 +1,161 @@
+'''Data access: the shared engine, retries, batched round trips and concurrent reads.'''
+
+# Imports
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import queries
+
+# Settings
+## The database is remote, so a handful of warm connections and short timeouts beat a big pool
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 4))
+MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 2))
+POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 30 * 60))
+STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30 * 1000))
+RETRIES = int(os.environ.get('DB_RETRIES', 3))
+
+_engine = None
+_lock = threading.Lock()
+
+
+# Engine
+def get_engine():
+    '''The shared SQLAlchemy engine, created on first use rather than at import.
+
+    Pooled connections remember the process that opened them. A forked
+    worker that checks out a connection inherited from the master discards it
+    and opens its own, so workers never share a socket.
+    '''
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                _engine = _create_engine(os.environ['pgs'])
+    return _engine
+
+
+def _create_engine(url):
+    from sqlalchemy import create_engine, event, exc
+    from sqlalchemy.engine import make_url
+
+    options = {'pool_pre_ping': True}
+    if make_url(url).get_backend_name() == 'postgresql':
+        options.update(pool_size = POOL_SIZE, max_overflow = MAX_OVERFLOW, pool_recycle = POOL_RECYCLE,
+                       connect_args = {'options': '-c statement_timeout={}'.format(STATEMENT_TIMEOUT_MS)})
+    engine = create_engine(url, **options)
+
+    @event.listens_for(engine, 'connect')
+    def remember_pid(dbapi_connection, connection_record):
+        connection_record.info['pid'] = os.getpid()
+
+    @event.listens_for(engine, 'connect')
+    def prepare_statements(dbapi_connection, connection_record):
+        if queries.PREPARE and engine.dialect.name == 'postgresql':
+            queries.prepare(dbapi_connection)
+
+    @event.listens_for(engine, 'checkout')
+    def check_pid(dbapi_connection, connection_record, connection_proxy):
+        if connection_record.info['pid'] != os.getpid():
+            connection_record.dbapi_connection = connection_proxy.dbapi_connection = None
+            raise exc.DisconnectionError('connection belongs to pid {}, reconnecting'.format(connection_record.info['pid']))
+
+    return engine
+
+
+def release():
+    '''Close the pooled connections, e.g. in the master before gunicorn forks workers.'''
+    global _executor
+    if _engine is not None:
+        _engine.dispose()
+    if _executor is not None and _executor_pid == os.getpid():
+        _executor.shutdown()
+        _executor = None
+
+
+# Retries
+def with_retry(fn):
+    '''Run ``fn`` and retry dropped connections with exponential backoff.'''
+    from sqlalchemy import exc
+    from tenacity import Retrying, retry_if_exception_type, stop_after_attempt, wait_exponential
+
+    retrying = Retrying(retry = retry_if_exception_type((exc.OperationalError, exc.DisconnectionError, exc.InterfaceError)),
+                        stop = stop_after_attempt(RETRIES),
+                        wait = wait_exponential(multiplier = .5, max = 8),
+                        reraise = True)
+    return retrying(fn)
+
+
+# Reads
+def read(statement, parse_dates = None, **params):
+    '''Run one statement into a DataFrame.'''
+    return with_retry(lambda: queries.read(statement, get_engine(), parse_dates = parse_dates, **params))
+
+
+def read_batch(requests, parse_dates = None):
+    '''Run several statements in a single round trip, returning a DataFrame per name.
+
+    ``requests`` maps a name to ``(statement, params)``. On Postgres every
+    statement becomes a ``json_agg`` column of one SELECT; elsewhere they run
+    one after another on a single pooled connection.
+    '''
+    parse_dates = parse_dates or {}
+    engine = get_engine()
+
+    if engine.dialect.name != 'postgresql':
+        def run():
+            with engine.connect() as con:
+                return {name: queries.read(statement, con, parse_dates = parse_dates.get(name), **params)
+                        for name, (statement, params) in requests.items()}
+        return with_retry(run)
+
+    clause, params = _batch_clause(requests)
+    row = with_retry(lambda: queries.read(clause, engine, **params)).iloc[0]
+
+    frames = {}
+    for name in requests:
+        records = row[name] if isinstance(row[name], list) else json.loads(row[name])
+        frame = pd.DataFrame.from_records(records)
+        for column in _as_list(parse_dates.get(name)):
+            if column in frame:
+                frame[column] = pd.to_datetime(frame[column])
+        frames[name] = frame
+    return frames
+
+
+def _batch_clause(requests):
+    ### Prefix each statement's parameters with its name so they can't collide
+    columns, params = [], {}
+    for name, (statement, args) in requests.items():
+        sql = re.sub(r'(?<!:):(\w+)', lambda m: ':{}__{}'.format(name, m.group(1)), statement.sql)
+        columns.append('(SELECT coalesce(json_agg(t), \'[]\'::json) FROM ({}) t) AS "{}"'.format(sql, name))
+        params.update({'{}__{}'.format(name, key): value for key, value in args.items()})
+    return queries.Statement('batch', 'SELECT ' + ',\n       '.join(columns), register = False), params
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+
+# Concurrency
+_executor = None
+_executor_pid = None
+
+
+def concurrently(*fns):
+    '''Call independent loaders on a thread pool and return their results in order.
+
+    Total latency is the slowest call rather than the sum of all of them.
+    '''
+    global _executor, _executor_pid
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers = POOL_SIZE, thread_name_prefix = 'db')
+            _executor_pid = os.getpid()
+    return [future.result() for future in [_executor.submit(fn) for fn in fns]]
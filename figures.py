@@ -0,0 +1,99 @@
+'''Figure caching and compact figure serialization.
+
+Computed values such as averages and standard deviations are sent in
+plotly.js's typed-array encoding (``{"dtype": "f4", "bdata": <base64>}``)
+instead of 17 digit JSON numbers. Readings with at most two decimals, counts
+and dates stay plain JSON: as short, repetitive text they compress better
+than their binary form. Hover labels format the dates in the browser with
+``%{x|...}`` instead of shipping a text list.
+'''
+
+# Imports
+import base64
+import json
+import os
+import threading
+
+import numpy as np
+import plotly.graph_objects as go
+from plotly.utils import PlotlyJSONEncoder
+
+# Settings
+## Single precision keeps 7 significant digits, more than any reading or average on the dashboard needs
+FLOAT_DTYPE = os.environ.get('FIGURE_FLOAT_DTYPE', 'f4')
+
+## Values already this short, like raw readings, are left as JSON numbers
+SHORT_DECIMALS = 2
+
+## Typed arrays need plotly.js 2.28 or newer, the one bundled with dash 2.0 is older
+PLOTLY_JS = 'https://cdn.plot.ly/plotly-2.35.2.min.js'
+
+
+# Figure Cache
+class FigureCache:
+    '''Serialized callback outputs, keyed by figure name and data version.
+
+    A figure is built once per data version, converted to plain JSON-ready
+    dicts, and handed back as-is to every client until the version changes.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._payloads = {}
+
+    def get(self, name, version, build):
+        key = _freeze(version)
+        with self._lock:
+            cached = self._payloads.get(name)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+
+        payload = serialize(build())
+        with self._lock:
+            self._payloads[name] = (key, payload)
+        return payload
+
+    def clear(self):
+        with self._lock:
+            self._payloads.clear()
+
+
+def serialize(output):
+    if isinstance(output, go.Figure):
+        return encode(output)
+    if isinstance(output, tuple):
+        return tuple(serialize(item) for item in output)
+    return output
+
+
+# Typed Arrays
+def encode(fig):
+    '''JSON-ready dict for ``fig`` with long floating point arrays as typed arrays.'''
+    figure = fig.to_plotly_json()
+    figure['data'] = [_encode(trace) for trace in figure.get('data', [])]
+    return json.loads(json.dumps(figure, cls = PlotlyJSONEncoder))
+
+
+def typed_array(values, dtype = FLOAT_DTYPE):
+    '''Plotly's base64 typed-array form of a one dimensional numeric array.'''
+    values = np.asarray(values)
+    return {'dtype': dtype, 'bdata': base64.b64encode(values.astype('<' + dtype).tobytes()).decode('ascii')}
+
+
+def _encode(value):
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if not isinstance(value, np.ndarray) or value.ndim != 1 or value.dtype.kind != 'f' or not len(value):
+        return value
+
+    ### Short decimals compress better as text than as float bytes
+    finite = value[np.isfinite(value)]
+    if np.array_equal(np.round(finite, SHORT_DECIMALS), finite):
+        return value
+    return typed_array(value)
+
+
+def _freeze(version):
+    if isinstance(version, (list, tuple)):
+        return tuple(_freeze(item) for item in version)
+    return version
@@ -0,0 +1,11 @@
+# Gunicorn settings, picked up automatically from the working directory
+import os
+
+## Each open live-update stream holds a thread, live.py caps them at LIVE_MAX_STREAMS per worker so callbacks keep the rest
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+
+## Import the app and warm its caches once in the master, forked workers inherit them copy-on-write
+preload_app = os.environ.get('PRELOAD_APP', '1') not in ('', '0')
+if preload_app:
+    os.environ.setdefault('WARM_ON_IMPORT', '1')
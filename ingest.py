@@ -0,0 +1,188 @@
+'''Bulk ingest of temperature readings posted to the dashboard.
+
+Readings arrive as JSON lines (``{"date": ..., "temp": ...}`` per line) or as
+CSV with a ``date,temp`` header, and are read from the request a batch at a
+time. Each batch is de-duplicated on its timestamp and written in one
+transaction. Rows whose timestamp is already stored are skipped, so a sender
+can safely retry a whole upload.
+
+On Postgres a batch goes through ``COPY`` into a temporary table and an
+``INSERT ... WHERE NOT EXISTS``, holding a transaction-level advisory lock so
+concurrent uploads can't store a timestamp twice. No schema change is needed.
+The lock only orders uploads against each other, not against the cron job's
+inserts of the current reading. Elsewhere, e.g. on the SQLite stand-in,
+stored timestamps are looked up first and the rest are inserted with one
+``executemany``, which is not safe against concurrent uploads.
+
+Timestamps with an offset are converted to ``LOCAL_TIMEZONE``, since
+``temp_log`` holds local wall-clock times; naive timestamps are taken as
+local already.
+
+Requests must carry ``Authorization: Bearer <INGEST_TOKEN>``; without the
+setting the route is turned off.
+'''
+
+# Imports
+import csv
+import hmac
+import io
+import json
+import os
+
+import pandas as pd
+
+import db
+import metrics
+import queries
+
+# Settings
+TOKEN = os.environ.get('INGEST_TOKEN', '')
+BATCH_ROWS = int(os.environ.get('INGEST_BATCH_ROWS', 5000))
+LOCAL_TIMEZONE = os.environ.get('LOCAL_TIMEZONE', 'America/New_York')
+
+JSON_LINES = ('application/x-ndjson', 'application/jsonl', 'application/json')
+CSV = ('text/csv', 'application/csv')
+
+
+# Parsing
+def parse(lines, mimetype):
+    '''Yield ``(date, temp)`` pairs from an iterable of text lines.'''
+    if mimetype in JSON_LINES:
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                yield record['date'], record['temp']
+            except (ValueError, TypeError, KeyError):
+                raise ValueError('line {}: expected an object with "date" and "temp"'.format(number))
+
+    elif mimetype in CSV:
+        reader = csv.DictReader(lines)
+        if not reader.fieldnames or not {'date', 'temp'} <= set(reader.fieldnames):
+            raise ValueError('CSV needs a header with "date" and "temp" columns')
+        for record in reader:
+            yield record['date'], record['temp']
+
+    else:
+        raise ValueError('unsupported content type {!r}, send JSON lines or CSV'.format(mimetype))
+
+
+def batches(pairs, size = BATCH_ROWS):
+    '''Group parsed pairs into DataFrames of at most ``size`` unique, sorted timestamps.'''
+    buffer = []
+    for pair in pairs:
+        buffer.append(pair)
+        if len(buffer) >= size:
+            yield _frame(buffer)
+            buffer = []
+    if buffer:
+        yield _frame(buffer)
+
+
+def _frame(pairs):
+    df = pd.DataFrame(pairs, columns = ['date', 'temp'])
+    try:
+        dates = pd.to_datetime(df['date'])
+        ### Mixed offsets don't fit one column until they share a zone
+        if dates.dtype == object:
+            dates = pd.to_datetime(df['date'], utc = True)
+        ### temp_log holds local wall-clock times, like the cron script writes them
+        if dates.dt.tz is not None:
+            dates = dates.dt.tz_convert(LOCAL_TIMEZONE).dt.tz_localize(None)
+        df['date'] = dates
+        df['temp'] = pd.to_numeric(df['temp'])
+    except (ValueError, TypeError, AttributeError) as error:
+        raise ValueError('unreadable reading: {}'.format(error))
+    if df['date'].isna().any() or df['temp'].isna().any():
+        raise ValueError('every reading needs a date and a temp')
+
+    ### The last copy of a repeated timestamp wins
+    return df.drop_duplicates('date', keep = 'last').sort_values('date', ignore_index = True)
+
+
+# Writing
+def write(df):
+    '''Insert the rows of ``df`` that aren't stored yet in one transaction, returning those rows.'''
+    engine = db.get_engine()
+    copy = _copy if engine.dialect.name == 'postgresql' else _executemany
+    with metrics.timed(metrics.query_seconds, 'ingest'):
+        inserted = db.with_retry(lambda: copy(engine, df))
+    metrics.query_rows.observe('ingest', len(inserted))
+    return inserted
+
+
+def _copy(engine, df):
+    buffer = io.StringIO()
+    df.to_csv(buffer, columns = ['date', 'temp'], header = False, index = False, date_format = '%Y-%m-%d %H:%M:%S.%f')
+    buffer.seek(0)
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(queries.ingest_lock)
+        cursor.execute(queries.ingest_buffer)
+        cursor.copy_expert(queries.ingest_copy, buffer)
+        cursor.execute(queries.ingest_merge)
+        rows = cursor.fetchall()
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    inserted = pd.DataFrame(rows, columns = ['date', 'temp'])
+    inserted['date'] = pd.to_datetime(inserted['date'])
+    return inserted.sort_values('date', ignore_index = True)
+
+
+def _executemany(engine, df):
+    start, end = df['date'].iloc[0].to_pydatetime(), df['date'].iloc[-1].to_pydatetime()
+    with engine.begin() as con:
+        stored = queries.read(queries.readings_between, con, parse_dates = 'date', start = start, end = end)
+        inserted = df.loc[~df['date'].isin(stored['date'])].reset_index(drop = True)
+        if len(inserted):
+            con.execute(queries.insert_reading.clause,
+                        [{'date': date.to_pydatetime(), 'temp': float(temp)} for date, temp in zip(inserted['date'], inserted['temp'])])
+    return inserted
+
+
+# Flask Route
+def init_app(server, on_commit, on_backfill, path = '/ingest', token = TOKEN):
+    '''Serve ``POST path`` and call ``on_commit(df)`` with the new rows after each batch commits.
+
+    ``on_commit`` returns True when some rows were older than the data held in
+    memory and couldn't be added in place. ``on_backfill()`` is then called
+    once, after the last batch of the request.
+    '''
+    from flask import jsonify, request
+
+    @server.route(path, methods = ['POST'])
+    def ingest():
+        if not token:
+            return jsonify(error = 'ingest is turned off, set INGEST_TOKEN'), 404
+
+        supplied = request.headers.get('Authorization', '').encode()
+        if not hmac.compare_digest(supplied, 'Bearer {}'.format(token).encode()):
+            return jsonify(error = 'unauthorized'), 401
+
+        ### Stream the body rather than reading a long backfill into memory at once
+        lines = (line.decode('utf-8') for line in request.stream)
+        received = inserted = 0
+        backfilled = False
+        try:
+            for batch in batches(parse(lines, request.mimetype)):
+                received += len(batch)
+                new = write(batch)
+                inserted += len(new)
+                if len(new):
+                    backfilled = on_commit(new) or backfilled
+        except (ValueError, UnicodeDecodeError) as error:
+            ### Batches before the bad line are already committed, say how many
+            return jsonify(error = str(error), received = received, inserted = inserted), 400
+        finally:
+            if backfilled:
+                on_backfill()
+
+        return jsonify(received = received, inserted = inserted, duplicates = received - inserted)
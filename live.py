@@ -0,0 +1,97 @@
+# Imports
+import json
+import os
+import queue
+import threading
+import time
+
+# Settings
+## How often to look for new rows, and how often to ping idle streams so proxies keep them open
+POLL_SECONDS = float(os.environ.get('LIVE_POLL_SECONDS', 60))
+HEARTBEAT_SECONDS = 25
+
+## Each held stream ties up a gunicorn thread, keep enough of them free for callbacks
+MAX_STREAMS = int(os.environ.get('LIVE_MAX_STREAMS', 8))
+
+
+# Version Broadcaster
+class VersionBroadcaster:
+    '''Pushes a "new data version" event to every connected browser.
+
+    A background thread calls ``check`` every ``interval`` seconds and, when
+    the versions it returns change, puts them on each subscriber's queue.
+    ``stream`` turns a subscription into a server-sent events body.
+
+    At most ``max_streams`` streams are held open per process. Past that a
+    browser gets the current versions and is told to reconnect after one
+    poll interval, which makes it poll instead of holding a thread.
+    '''
+
+    def __init__(self, check, interval = POLL_SECONDS, max_streams = MAX_STREAMS):
+        self.check = check
+        self.interval = interval
+        self.versions = None
+        self._slots = threading.BoundedSemaphore(max_streams)
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        ### Threads don't survive a fork, so each worker process starts its own
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target = self._run, name = 'version-broadcaster', daemon = True)
+            self._thread.start()
+
+    def publish(self, versions):
+        with self._lock:
+            if versions == self.versions:
+                return
+            self.versions = versions
+            subscribers = list(self._subscribers)
+
+        for subscriber in subscribers:
+            subscriber.put(versions)
+
+    def subscribe(self):
+        subscriber = queue.Queue()
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self.versions is not None:
+                subscriber.put(self.versions)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def stream(self):
+        if not self._slots.acquire(blocking = False):
+            yield 'retry: {}\n\n'.format(int(self.interval * 1000))
+            if self.versions is not None:
+                yield 'event: version\ndata: {}\n\n'.format(json.dumps(self.versions))
+            return
+
+        subscriber = self.subscribe()
+        try:
+            while True:
+                try:
+                    versions = subscriber.get(timeout = HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ': ping\n\n'
+                    continue
+                yield 'event: version\ndata: {}\n\n'.format(json.dumps(versions))
+        finally:
+            self.unsubscribe(subscriber)
+            self._slots.release()
+
+    def _run(self):
+        while True:
+            try:
+                self.publish(self.check())
+            except Exception as error:
+                print('version check failed: {}'.format(error), flush = True)
+            time.sleep(self.interval)
@@ -0,0 +1,113 @@
+# Imports
+import bisect
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Settings
+## Calls slower than this many milliseconds are logged, 0 turns the log off
+SLOW_CALL_MS = float(os.environ.get('SLOW_CALL_MS', 0))
+
+SECONDS_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+ROWS_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+BYTES_BUCKETS = (1000, 10000, 50000, 100000, 250000, 500000, 1000000, 5000000)
+
+
+# Histograms
+class Histogram:
+    '''Cumulative Prometheus-style histogram, one series per label value.'''
+
+    def __init__(self, name, help, buckets, label = 'name'):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.label = label
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, label, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} histogram'.format(self.name)]
+        with self._lock:
+            series = {label: (list(counts), total, count) for label, (counts, total, count) in self._series.items()}
+
+        for label, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket
+                lines.append('{}_bucket{{{}="{}",le="{}"}} {}'.format(self.name, self.label, label, bound, cumulative))
+            lines.append('{}_sum{{{}="{}"}} {}'.format(self.name, self.label, label, total))
+            lines.append('{}_count{{{}="{}"}} {}'.format(self.name, self.label, label, count))
+        return '\n'.join(lines)
+
+
+query_seconds = Histogram('dashboard_query_seconds', 'Database query latency.', SECONDS_BUCKETS, label = 'query')
+query_rows = Histogram('dashboard_query_rows', 'Rows returned per database query.', ROWS_BUCKETS, label = 'query')
+callback_seconds = Histogram('dashboard_callback_seconds', 'Dash callback latency, including figure building.', SECONDS_BUCKETS, label = 'callback')
+figure_seconds = Histogram('dashboard_figure_build_seconds', 'Time spent building figures.', SECONDS_BUCKETS, label = 'figure')
+response_bytes = Histogram('dashboard_response_bytes', 'Callback response size as sent, after compression.', BYTES_BUCKETS, label = 'output')
+
+HISTOGRAMS = [query_seconds, query_rows, callback_seconds, figure_seconds, response_bytes]
+
+
+# Timing
+@contextmanager
+def timed(histogram, label):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.observe(label, elapsed)
+        if SLOW_CALL_MS and elapsed * 1000 >= SLOW_CALL_MS:
+            print('slow {} {}: {:.1f} ms'.format(histogram.label, label, elapsed * 1000), flush = True)
+
+
+def instrument(histogram, label = None):
+    '''Decorator form of ``timed``, labelled with the function name by default.'''
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(histogram, label or fn.__name__):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def read_sql(name, sql, **kwargs):
+    '''``pd.read_sql`` that records latency and row count under the query's name.'''
+    import pandas as pd
+
+    with timed(query_seconds, name):
+        df = pd.read_sql(sql, **kwargs)
+    query_rows.observe(name, len(df))
+    return df
+
+
+# Flask Hooks
+def init_app(server, path = '/metrics'):
+    from flask import Response, request
+
+    @server.after_request
+    def record_response_size(response):
+        ### Dash posts every callback to the same route, the output id says which one it was
+        if request.path.endswith('/_dash-update-component') and not response.direct_passthrough:
+            output = (request.get_json(silent = True) or {}).get('output', 'unknown')
+            response_bytes.observe(output, response.calculate_content_length() or 0)
+        return response
+
+    @server.route(path)
+    def metrics():
+        return Response('\n'.join(histogram.render() for histogram in HISTOGRAMS) + '\n',
+                        mimetype = 'text/plain; version=0.0.4')
@@ -0,0 +1,133 @@
+# Imports
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Settings
+## Roughly how wide a graph is on a desktop screen, and how many points to send per pixel of it
+GRAPH_WIDTH = int(os.environ.get('GRAPH_WIDTH', 1200))
+POINTS_PER_PX = float(os.environ.get('POINTS_PER_PX', 2))
+
+## numpy weeks start on Thursday (1970-01-01), shift them to start on Monday
+MONDAY = np.timedelta64(4, 'D')
+
+
+def _floor(unit):
+    def floor(dates):
+        return dates.astype('datetime64[{}]'.format(unit)).astype('datetime64[ns]')
+    return floor
+
+def _floor_week(dates):
+    return (dates - MONDAY).astype('datetime64[W]').astype('datetime64[ns]') + MONDAY
+
+
+# Aggregated Tier
+class _Tier:
+    def __init__(self, name, floor):
+        self.name = name
+        self.floor = floor
+        self._starts = []
+        self._count = []
+        self._sum = []
+        self._min = []
+        self._max = []
+        self._arrays = None
+
+    def __len__(self):
+        return len(self._starts)
+
+    def extend(self, dates, temps):
+        keys, starts = np.unique(self.floor(dates), return_index = True)
+        counts = np.diff(np.append(starts, len(temps)))
+        sums = np.add.reduceat(temps, starts)
+        mins = np.minimum.reduceat(temps, starts)
+        maxs = np.maximum.reduceat(temps, starts)
+
+        for key, n, s, mn, mx in zip(keys, counts, sums, mins, maxs):
+            ### Readings arrive in order, so only the newest bucket can still be open
+            if self._starts and self._starts[-1] == key:
+                self._count[-1] += n
+                self._sum[-1] += s
+                self._min[-1] = min(self._min[-1], mn)
+                self._max[-1] = max(self._max[-1], mx)
+            else:
+                self._starts.append(key)
+                self._count.append(n)
+                self._sum.append(s)
+                self._min.append(mn)
+                self._max.append(mx)
+
+        self._arrays = None
+
+    def arrays(self):
+        if self._arrays is None:
+            count = np.array(self._count, dtype = 'float64')
+            self._arrays = (np.array(self._starts, dtype = 'datetime64[ns]'),
+                            np.array(self._sum, dtype = 'float64') / count,
+                            np.array(self._min, dtype = 'float64'),
+                            np.array(self._max, dtype = 'float64'))
+        return self._arrays
+
+    def count(self, start, end):
+        lo, hi = self._slice(start, end)
+        return hi - lo
+
+    def window(self, start, end):
+        starts, means, mins, maxs = self.arrays()
+        lo, hi = self._slice(start, end)
+        return pd.DataFrame({'date': starts[lo:hi], 'temp': means[lo:hi], 'min': mins[lo:hi], 'max': maxs[lo:hi]})
+
+    def _slice(self, start, end):
+        ### Include the bucket that the window starts part way through
+        starts = self.arrays()[0]
+        first = self.floor(np.array([start], dtype = 'datetime64[ns]'))[0]
+        return np.searchsorted(starts, first), np.searchsorted(starts, end, side = 'right')
+
+
+# Rollup Pyramid
+class RollupPyramid:
+    '''Raw readings plus hourly, daily and weekly pre-aggregates.
+
+    A range request is answered from the finest tier that fits in about
+    ``POINTS_PER_PX`` points per pixel of graph width, so a full-history view
+    stays small while zooming into any past week returns raw readings.
+    '''
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self.reset()
+        store.subscribe(self.extend, reset = self.reset)
+
+    def reset(self):
+        with self._lock:
+            self.tiers = [_Tier('hourly', _floor('h')), _Tier('daily', _floor('D')), _Tier('weekly', _floor_week)]
+
+    def extend(self, dates, temps):
+        with self._lock:
+            for tier in self.tiers:
+                tier.extend(dates, temps)
+
+    def query(self, start = None, end = None, width = GRAPH_WIDTH):
+        '''Return ``(tier name, DataFrame)`` for readings between ``start`` and ``end``.'''
+        first, last = self.store.bounds()
+        if first is None:
+            return 'raw', pd.DataFrame({'date': np.array([], dtype = 'datetime64[ns]'), 'temp': np.array([], dtype = 'float64')})
+
+        start = pd.Timestamp(start).to_datetime64() if start is not None else first
+        end = pd.Timestamp(end).to_datetime64() if end is not None else last
+        budget = width * POINTS_PER_PX
+
+        ### Raw rows are counted per segment without copying them
+        raw = sum(np.searchsorted(dates, end, side = 'right') - np.searchsorted(dates, start)
+                  for dates, temps in self.store.segments())
+        if raw <= budget:
+            dates, temps = self.store.window(start, end)
+            return 'raw', pd.DataFrame({'date': dates, 'temp': temps})
+
+        with self._lock:
+            for tier in self.tiers:
+                if tier.count(start, end) <= budget or tier is self.tiers[-1]:
+                    return tier.name, tier.window(start, end)
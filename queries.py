@@ -1,16 +1,108 @@
-from datetime import datetime, timedelta
+'''SQL for the dashboard, as named statements with bound parameters.
+
+Time windows are passed in at call time rather than formatted into the SQL, so
+a long-running worker always asks for exactly the window it wants. On Postgres
+the statements the app runs on its own (``prepared = True``) are ``PREPARE``d
+in one round trip per pooled connection and run with ``EXECUTE`` afterwards;
+everything else, and every statement on other databases, runs as plain SQL.
+
+The ingest statements at the end are plain SQL rather than prepared, since the
+temporary table they read from only exists inside an ingest transaction.
+'''
+
+# Imports
+import os
+import re
+
+from sqlalchemy import text
+
+import metrics
+
+# Settings
+## Server-side prepared statements don't survive transaction-pooling proxies such as pgbouncer
+PREPARE = os.environ.get('PREPARED_STATEMENTS', '1') not in ('', '0')
+
+STATEMENTS = {}
+
+
+# Statements
+class Statement:
+    def __init__(self, name, sql, register = True, prepared = False, **types):
+        self.name = name
+        self.sql = sql.strip().rstrip(';')
+        self.types = types
+        self.clause = text(self.sql)
+        ### Only statements the app runs by themselves are worth preparing on each connection
+        self.prepared = prepared
+        if register:
+            STATEMENTS[name] = self
+
+    def prepare_sql(self):
+        ### Bound :names become positional $n placeholders in a prepared statement
+        params = list(self.types)
+        body = re.sub(r'(?<!:):(\w+)', lambda m: '${}'.format(params.index(m.group(1)) + 1), self.sql)
+        types = ' ({})'.format(', '.join(self.types.values())) if params else ''
+        return 'PREPARE {}{} AS {}'.format(self.name, types, body)
+
+    def execute_clause(self):
+        args = '({})'.format(', '.join(':' + param for param in self.types)) if self.types else ''
+        return text('EXECUTE {}{}'.format(self.name, args))
+
+    def __str__(self):
+        return self.sql
+
+
+def prepare(dbapi_connection):
+    '''Prepare the app's statements on a freshly opened Postgres connection, in one round trip.'''
+    sql = ';\n'.join(statement.prepare_sql() for statement in STATEMENTS.values() if statement.prepared)
+    if not sql:
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute(sql)
+    cursor.close()
+    dbapi_connection.commit()
+
+
+def read(statement, con, parse_dates = None, **params):
+    '''Run ``statement`` with ``params`` into a DataFrame, using the prepared copy on Postgres.'''
+    prepared = PREPARE and statement.prepared and con.dialect.name == 'postgresql'
+    clause = statement.execute_clause() if prepared else statement.clause
+    return metrics.read_sql(statement.name, clause, con = con, params = params, parse_dates = parse_dates)
+
 
 # Current Temp
-current_temp = '''
-SELECT *
+current_temp = Statement('current_temp', '''
+SELECT date, temp
 FROM "dkelly-proj/cbus_temps"."temp_log"
-WHERE date = (
-    SELECT max(date)
-    FROM "dkelly-proj/cbus_temps"."temp_log");
-'''
+ORDER BY date DESC
+LIMIT 1;
+''')
+
+# All Readings
+readings = Statement('readings', '''
+SELECT date, temp
+FROM "dkelly-proj/cbus_temps"."temp_log"
+ORDER BY 1;
+''', prepared = True)
+
+# Readings Since Last Seen
+readings_since = Statement('readings_since', '''
+SELECT date, temp
+FROM "dkelly-proj/cbus_temps"."temp_log"
+WHERE date > :last_seen
+ORDER BY 1;
+''', last_seen = 'timestamp')
+
+# Readings In A Window
+readings_between = Statement('readings_between', '''
+SELECT date, temp
+FROM "dkelly-proj/cbus_temps"."temp_log"
+WHERE date >= :start AND date <= :end
+ORDER BY 1;
+''', start = 'timestamp', end = 'timestamp')
 
 # Daily Averages
-daily = '''
+daily = Statement('daily', '''
 WITH avg_temp_tbl AS (
   SELECT date_trunc('day', date) "date", avg(temp) "temp"
   FROM "dkelly-proj/cbus_temps"."temp_log"
@@ -22,43 +114,82 @@ SELECT
   over(order by date rows between 9 preceding and current row)
   as moving_avg
 FROM avg_temp_tbl;
-'''
+''')
 
 # Record Low
-low = '''
+low = Statement('low', '''
 SELECT date, temp
 FROM "dkelly-proj/cbus_temps"."temp_log"
 WHERE temp = (
     SELECT min(temp)
     FROM "dkelly-proj/cbus_temps"."temp_log");
-'''
+''')
 
 # Record High
-high = '''
+high = Statement('high', '''
 SELECT date, temp
 FROM "dkelly-proj/cbus_temps"."temp_log"
 WHERE temp = (
     SELECT max(temp)
     FROM "dkelly-proj/cbus_temps"."temp_log");
-'''
+''')
 
 # Daily Highs and Lows
-daily_hl = '''
+daily_hl = Statement('daily_hl', '''
 Select date_trunc('day', date) "date", max(temp) "max", min(temp) "min"
 from "dkelly-proj/cbus_temps"."temp_log"
 group by 1
 order by 1;
-'''
+''')
 
 # Last Week
-weekly = '''
+weekly = Statement('weekly', '''
 Select date, temp
 from "dkelly-proj/cbus_temps"."temp_log"
-where "date" >= date('{}')
+where "date" >= :start
 order by 1;
-'''.format((datetime.today() - timedelta(days = 7)).strftime('%Y-%m-%d'))
+''', start = 'timestamp')
+
+# Humidity Version
+hum_version = Statement('hum_version', '''
+SELECT count(*) AS days, max(date) AS last_day
+FROM "dkelly-proj/cbus_temps"."humidity-temps";
+''')
 
 # Humidity Clustering
-hum_cluster = '''
+hum_cluster = Statement('hum_cluster', '''
 SELECT * FROM "dkelly-proj/cbus_temps"."humidity-temps";
+''', prepared = True)
+
+# Ingest
+## Uploads take turns for the rest of their transaction, so two can't both find a timestamp missing and insert it
+ingest_lock = '''
+SELECT pg_advisory_xact_lock(hashtext('dkelly-proj/cbus_temps.temp_log ingest'));
+'''
+
+## Posted readings are copied into a temporary table, then only timestamps not already stored are inserted
+ingest_buffer = '''
+CREATE TEMPORARY TABLE ingest_buffer (date timestamp, temp double precision) ON COMMIT DROP;
 '''
+
+ingest_copy = '''
+COPY ingest_buffer (date, temp) FROM STDIN WITH (FORMAT csv);
+'''
+
+ingest_merge = '''
+INSERT INTO "dkelly-proj/cbus_temps"."temp_log" (date, temp)
+SELECT DISTINCT ON (date) date, temp
+FROM ingest_buffer b
+WHERE NOT EXISTS (
+    SELECT 1
+    FROM "dkelly-proj/cbus_temps"."temp_log" t
+    WHERE t.date = b.date)
+ORDER BY date
+RETURNING date, temp;
+'''
+
+## Elsewhere rows not already stored are inserted with a single executemany
+insert_reading = Statement('insert_reading', '''
+INSERT INTO "dkelly-proj/cbus_temps"."temp_log" (date, temp)
+VALUES (:date, :temp);
+''', register = False)
@@ -0,0 +1,131 @@
+# Imports
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+# Daily Rollups
+class RollupEngine:
+    '''Per-day count, sum, min, max and sum of squares plus all-time records.
+
+    Readings are folded in as they arrive, so every new reading costs O(1) and
+    only the tail of the 10-day moving average touched by it is recomputed.
+    '''
+
+    def __init__(self, window = 10):
+        self.window = window
+        self._lock = threading.Lock()
+        self.reset()
+
+    def __len__(self):
+        return len(self._days)
+
+    ## Updates
+    def reset(self):
+        with self._lock:
+            self._index = {}
+            self._days = []
+            self._count = []
+            self._sum = []
+            self._sumsq = []
+            self._min = []
+            self._max = []
+            self._sma = []
+            self._dirty = 0
+            self.low = None
+            self.high = None
+
+    def extend(self, dates, temps):
+        if not len(dates):
+            return
+
+        ### Group the batch by day so each touched day is merged once
+        days, starts = np.unique(dates.astype('datetime64[D]'), return_index = True)
+        counts = np.diff(np.append(starts, len(temps)))
+        sums = np.add.reduceat(temps, starts)
+        sumsqs = np.add.reduceat(temps * temps, starts)
+        mins = np.minimum.reduceat(temps, starts)
+        maxs = np.maximum.reduceat(temps, starts)
+
+        lo, hi = temps.argmin(), temps.argmax()
+
+        with self._lock:
+            for day, n, s, ss, mn, mx in zip(days, counts, sums, sumsqs, mins, maxs):
+                self._merge(day, n, s, ss, mn, mx)
+
+            if self.low is None or temps[lo] < self.low[1]:
+                self.low = (dates[lo], temps[lo])
+            if self.high is None or temps[hi] > self.high[1]:
+                self.high = (dates[hi], temps[hi])
+
+            self._update_sma()
+
+    def _merge(self, day, n, s, ss, mn, mx):
+        i = self._index.get(day)
+        if i is None:
+            i = self._index[day] = len(self._days)
+            self._days.append(day)
+            self._count.append(0)
+            self._sum.append(0.0)
+            self._sumsq.append(0.0)
+            self._min.append(mn)
+            self._max.append(mx)
+            self._sma.append(np.nan)
+
+        self._count[i] += n
+        self._sum[i] += s
+        self._sumsq[i] += ss
+        self._min[i] = min(self._min[i], mn)
+        self._max[i] = max(self._max[i], mx)
+        self._dirty = min(self._dirty, i)
+
+    def _update_sma(self):
+        ### A changed day only affects the averages of the next `window` days
+        for i in range(self._dirty, len(self._days)):
+            first = max(0, i - self.window + 1)
+            means = [self._sum[j] / self._count[j] for j in range(first, i + 1)]
+            self._sma[i] = sum(means) / len(means)
+        self._dirty = len(self._days)
+
+    ## Datasets
+    def daily(self):
+        with self._lock:
+            count = np.array(self._count, dtype = 'float64')
+            return pd.DataFrame({'date': self._dates(),
+                                 'temp': np.array(self._sum) / count,
+                                 'moving_avg': np.array(self._sma, dtype = 'float64')})
+
+    def daily_hl(self):
+        with self._lock:
+            return pd.DataFrame({'date': self._dates(),
+                                 'max': np.array(self._max, dtype = 'float64'),
+                                 'min': np.array(self._min, dtype = 'float64')})
+
+    def daily_std(self):
+        with self._lock:
+            count = np.array(self._count, dtype = 'float64')
+            total = np.array(self._sum, dtype = 'float64')
+            sumsq = np.array(self._sumsq, dtype = 'float64')
+            dates = self._dates()
+
+        ### Sample standard deviation, matching Postgres stddev()
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            var = np.clip(sumsq - total * total / count, 0, None) / (count - 1)
+        std = np.where(count > 1, np.sqrt(var), np.nan)
+        return pd.DataFrame({'date': dates, 'std_temp': std})
+
+    def record_low(self):
+        return _record(self.low)
+
+    def record_high(self):
+        return _record(self.high)
+
+    def _dates(self):
+        return np.array(self._days, dtype = 'datetime64[D]').astype('datetime64[ns]')
+
+
+def _record(record):
+    if record is None:
+        return pd.DataFrame({'date': np.array([], dtype = 'datetime64[ns]'), 'temp': np.array([], dtype = 'float64')})
+    return pd.DataFrame({'date': [pd.Timestamp(record[0])], 'temp': [float(record[1])]})
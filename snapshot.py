@@ -0,0 +1,98 @@
+# Imports
+import os
+import threading
+import time
+
+# Settings
+## Matches the 15 minute cadence of the basement cron job
+DEFAULT_TTL = float(os.environ.get('SNAPSHOT_TTL', 15 * 60))
+
+
+# Snapshot Cache
+class SnapshotCache:
+    '''Server-side cache holding one snapshot of each dashboard dataset.
+
+    Every dataset is fetched through its loader at most once per ``ttl``
+    seconds, no matter how many callbacks or browser tabs ask for it. When
+    a snapshot is missing or stale, the first caller runs the loader and any
+    concurrent callers wait for that same fetch instead of issuing their own.
+
+    A dataset can depend on others, in which case it is rebuilt whenever one
+    of them has been refetched since it was last built.
+    '''
+
+    def __init__(self, loaders, ttl = DEFAULT_TTL, depends = None):
+        self.loaders = dict(loaders)
+        self.depends = dict(depends or {})
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._values = {}
+        self._fetched = {}
+        self._inflight = {}
+
+    def register(self, name, loader, depends = ()):
+        self.loaders[name] = loader
+        self.depends[name] = tuple(depends)
+
+    def get(self, name):
+        for dependency in self.depends.get(name, ()):
+            self.get(dependency)
+
+        with self._lock:
+            if self._is_fresh(name):
+                return self._values[name]
+
+            flight = self._inflight.get(name)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[name] = _Flight()
+
+        ### Someone else is already fetching, wait for their result
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            value = self.loaders[name]()
+        except BaseException as error:
+            flight.error = error
+            with self._lock:
+                del self._inflight[name]
+            flight.done.set()
+            raise
+
+        flight.value = value
+        with self._lock:
+            self._values[name] = value
+            self._fetched[name] = time.monotonic()
+            del self._inflight[name]
+        flight.done.set()
+        return value
+
+    def put(self, name, value):
+        '''Store ``value`` as a fresh snapshot of ``name``, e.g. after updating it in place.'''
+        with self._lock:
+            self._values[name] = value
+            self._fetched[name] = time.monotonic()
+
+    def invalidate(self, name = None):
+        with self._lock:
+            if name is None:
+                self._fetched.clear()
+            else:
+                self._fetched.pop(name, None)
+
+    def _is_fresh(self, name):
+        fetched = self._fetched.get(name)
+        if fetched is None or time.monotonic() - fetched >= self.ttl:
+            return False
+        return all(self._fetched.get(dependency, fetched) <= fetched for dependency in self.depends.get(name, ()))
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
@@ -0,0 +1,61 @@
+'''Startup timing: how long each top-level import and warm-up step takes.
+
+Set ``STARTUP_REPORT=1`` to print the report. With it set, ``track_imports``
+times every top-level import until ``report`` is called, attributing nested
+imports to the import that triggered them; otherwise it installs nothing.
+Warm-up work is timed with ``step``.
+'''
+
+# Imports
+import builtins
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+ENABLED = os.environ.get('STARTUP_REPORT', '') not in ('', '0')
+
+_timings = []
+_original_import = builtins.__import__
+_depth = 0
+
+
+def _timed_import(name, globals = None, locals = None, fromlist = (), level = 0):
+    global _depth
+    if _depth or level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    _depth += 1
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _depth -= 1
+        _timings.append(('import ' + name, time.perf_counter() - start))
+
+
+def track_imports():
+    if ENABLED:
+        builtins.__import__ = _timed_import
+
+
+@contextmanager
+def step(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _timings.append((name, time.perf_counter() - start))
+
+
+def report():
+    builtins.__import__ = _original_import
+    if not ENABLED:
+        return
+
+    total = sum(seconds for name, seconds in _timings)
+    lines = ['Startup report for pid {} ({:.2f} s)'.format(os.getpid(), total)]
+    for name, seconds in sorted(_timings, key = lambda item: -item[1]):
+        if seconds >= .001:
+            lines.append('  {:>8.1f} ms  {}'.format(seconds * 1000, name))
+    print('\n'.join(lines), file = sys.stderr, flush = True)
@@ -0,0 +1,217 @@
+# Imports
+import os
+import threading
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+import columnar
+import queries
+
+# Settings
+## Rewrite the on-disk snapshot once this many rows have piled up outside it (one day of readings)
+FLUSH_ROWS = int(os.environ.get('SNAPSHOT_FLUSH_ROWS', 96))
+
+
+# Time Series Store
+class TimeSeriesStore:
+    '''In-memory copy of ``temp_log`` held in NumPy columns.
+
+    The full table is read once, after which each refresh (``next_query``
+    then ``apply``) only pulls rows newer than the last timestamp seen and
+    appends them, so a refresh costs as much as the number of new rows
+    rather than the age of the dataset.
+
+    With a ``snapshot`` name the bulk of the rows live in a memory-mapped
+    columnar file shared by every worker, and only the rows newer than that
+    file are held privately. A restarted worker maps the file and then only
+    fetches the delta from the database.
+
+    Rows older than the newest one held can't be appended; ``discard`` drops
+    everything instead, and every worker sharing the snapshot reloads the
+    whole table on its next refresh.
+    '''
+
+    def __init__(self, capacity = 1024, snapshot = None):
+        self.snapshot = snapshot
+        self._snapshot_tag = None
+        self._generation = None
+        self._base_dates = np.empty(0, dtype = 'datetime64[ns]')
+        self._base_temps = np.empty(0, dtype = 'float64')
+        self._dates = np.empty(capacity, dtype = 'datetime64[ns]')
+        self._temps = np.empty(capacity, dtype = 'float64')
+        self._size = 0
+        self._lock = threading.RLock()
+        self._listeners = []
+
+    def __len__(self):
+        return len(self._base_dates) + self._size
+
+    @property
+    def last_seen(self):
+        if self._size:
+            return self._dates[self._size - 1]
+        return self._base_dates[-1] if len(self._base_dates) else None
+
+    @property
+    def version(self):
+        return (len(self), str(self.last_seen))
+
+    def segments(self):
+        ### The shared on-disk rows, then the private rows appended since
+        with self._lock:
+            return [(self._base_dates, self._base_temps), (self._dates[:self._size], self._temps[:self._size])]
+
+    def window(self, start = None, end = None):
+        '''Dates and temperatures with ``start <= date <= end``, copying only that slice.'''
+        dates, temps = [], []
+        for segment_dates, segment_temps in self.segments():
+            lo = np.searchsorted(segment_dates, start) if start is not None else 0
+            hi = np.searchsorted(segment_dates, end, side = 'right') if end is not None else len(segment_dates)
+            dates.append(segment_dates[lo:hi])
+            temps.append(segment_temps[lo:hi])
+        return np.concatenate(dates), np.concatenate(temps)
+
+    def bounds(self):
+        with self._lock:
+            if not len(self):
+                return None, None
+            first = self._base_dates[0] if len(self._base_dates) else self._dates[0]
+            return first, self.last_seen
+
+    ## Ingestion
+    def subscribe(self, listener, reset = None):
+        '''Call ``listener(dates, temps)`` with every appended batch, starting with the rows already held.
+
+        ``reset()`` is called whenever the held rows are discarded.
+        '''
+        with self._lock:
+            self._listeners.append((listener, reset))
+            for dates, temps in self.segments():
+                if len(dates):
+                    listener(dates, temps)
+
+    def next_query(self):
+        '''The statement and parameters that fetch the rows this store is missing.'''
+        with self._lock:
+            if self.snapshot is not None:
+                ### Another worker discarded the shared rows, start again from the full table
+                generation = columnar.generation(self.snapshot)
+                if self._generation is not None and generation != self._generation:
+                    self._reset()
+                self._generation = generation
+                self._adopt_snapshot()
+
+            if len(self):
+                return queries.readings_since, {'last_seen': pd.Timestamp(self.last_seen).to_pydatetime()}
+            return queries.readings, {}
+
+    def apply(self, df):
+        with self._lock:
+            ### Nothing new, and a batched empty result comes back without columns
+            if not len(df):
+                return self.version
+
+            ### Drop anything already held, e.g. if another refresh got there first
+            df = df.sort_values('date')
+            dates = df['date'].to_numpy(dtype = 'datetime64[ns]')
+            keep = dates > self.last_seen if len(self) else np.ones(len(dates), dtype = bool)
+            self.append(dates[keep], df['temp'].to_numpy(dtype = 'float64')[keep])
+
+            if self.snapshot is not None and self._size >= FLUSH_ROWS:
+                self._write_snapshot()
+            return self.version
+
+    def append(self, dates, temps):
+        with self._lock:
+            new = len(dates)
+            if not new:
+                return 0
+
+            needed = self._size + new
+            if needed > len(self._dates):
+                capacity = max(needed, 2 * len(self._dates))
+                self._dates = _grow(self._dates, self._size, capacity)
+                self._temps = _grow(self._temps, self._size, capacity)
+
+            self._dates[self._size:needed] = dates
+            self._temps[self._size:needed] = temps
+            self._size = needed
+
+            self._notify(self._dates[needed - new:needed], self._temps[needed - new:needed])
+            return new
+
+    def discard(self):
+        '''Drop every held row, e.g. after older rows were backfilled, so the next refresh reloads them all.'''
+        with self._lock:
+            if self.snapshot is not None:
+                self._generation = columnar.retire(self.snapshot)
+            self._reset()
+
+    def _reset(self):
+        self._snapshot_tag = None
+        self._base_dates = self._base_dates[:0].copy()
+        self._base_temps = self._base_temps[:0].copy()
+        self._dates = np.empty_like(self._dates)
+        self._temps = np.empty_like(self._temps)
+        self._size = 0
+        for listener, reset in self._listeners:
+            if reset is not None:
+                reset()
+
+    def _notify(self, dates, temps):
+        for listener, reset in self._listeners:
+            listener(dates, temps)
+
+    ## Shared Snapshot
+    def _adopt_snapshot(self):
+        ### Swap in a newer on-disk snapshot, keeping only the private rows it doesn't cover yet
+        if columnar.current(self.snapshot) in (None, self._snapshot_tag):
+            return
+
+        tag, columns = columnar.load(self.snapshot)
+        if columns is None:
+            return
+
+        dates, temps = columns['date'], columns['temp']
+        held, shared = len(self), len(self._base_dates)
+        if len(dates) < shared:
+            return
+
+        ### Fresh buffers, since readers may still hold views of the old ones from segments()
+        covered = min(len(dates), held) - shared
+        self._dates = _grow(self._dates[covered:self._size], self._size - covered, len(self._dates))
+        self._temps = _grow(self._temps[covered:self._size], self._size - covered, len(self._temps))
+        self._size -= covered
+        self._base_dates, self._base_temps, self._snapshot_tag = dates, temps, tag
+
+        if len(dates) > held:
+            self._notify(dates[held:], temps[held:])
+
+    def _write_snapshot(self):
+        with columnar.writer_lock(self.snapshot) as acquired:
+            ### Never republish rows from before a discard
+            if not acquired or columnar.generation(self.snapshot) != self._generation:
+                return
+            dates, temps = self.window()
+            self._snapshot_tag = None
+            columnar.save(self.snapshot, {'date': dates, 'temp': temps})
+            self._adopt_snapshot()
+
+    ## Derived Datasets
+    def current_temp(self):
+        first, last = self.bounds()
+        dates, temps = self.window(last, last)
+        return pd.DataFrame({'date': dates[-1:], 'temp': temps[-1:]})
+
+    def weekly(self, days = 7):
+        cutoff = pd.Timestamp.today().normalize() - timedelta(days = days)
+        dates, temps = self.window(cutoff.to_datetime64())
+        return pd.DataFrame({'date': dates, 'temp': temps})
+
+
+def _grow(column, size, capacity):
+    grown = np.empty(capacity, dtype = column.dtype)
+    grown[:size] = column[:size]
+    return grown
@@ -0,0 +1,10 @@
+# Imports
+import os
+import sys
+import tempfile
+
+## The app's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+## Keep snapshots written by the tests away from a running dashboard
+os.environ.setdefault('SNAPSHOT_DIR', tempfile.mkdtemp(prefix = 'dustins-house-tests-'))
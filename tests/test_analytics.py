@@ -0,0 +1,51 @@
+# Imports
+import numpy as np
+import pandas as pd
+import pytest
+
+from analytics import humidity_stats
+
+
+def humidity_days(count = 200, seed = 3):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'avg_humidity': rng.uniform(30, 95, count), 'std_temp': rng.gamma(4, 1.2, count),
+                       'cluster': rng.integers(0, 3, count)})
+    ### Missing readings come through as NaN, and the 75th percentile can fall on a repeated value
+    df.loc[[5, 17, 60], 'avg_humidity'] = np.nan
+    df.loc[[8, 90], 'std_temp'] = np.nan
+    df.loc[100:110, 'avg_humidity'] = df['avg_humidity'].quantile(.75)
+    return df
+
+
+# Humidity Statistics
+def test_humidity_stats_match_pandas():
+    df = humidity_days()
+    stats = humidity_stats(df['avg_humidity'], df['std_temp'], df['cluster'])
+
+    ### What the writeup computed with pandas before
+    per_75 = df.avg_humidity.quantile(.75)
+    high = df.avg_humidity >= per_75
+    assert stats.count == len(df)
+    assert stats.per_75 == pytest.approx(per_75)
+    np.testing.assert_array_equal(stats.high, high.to_numpy())
+    assert stats.count_high == high.sum()
+    assert stats.all_std == pytest.approx(df.std_temp.mean())
+    assert stats.high_std == pytest.approx(df.loc[high, 'std_temp'].mean())
+
+
+def test_clusters_hold_the_rows_of_each_label():
+    df = humidity_days()
+    stats = humidity_stats(df['avg_humidity'], df['std_temp'], df['cluster'])
+
+    assert sorted(stats.clusters) == sorted(df.cluster.unique())
+    for cluster, rows in df.groupby('cluster').indices.items():
+        np.testing.assert_array_equal(stats.clusters[cluster], rows)
+
+
+def test_histogram_skips_missing_humidity():
+    df = humidity_days()
+    stats = humidity_stats(df['avg_humidity'], df['std_temp'], df['cluster'])
+
+    assert stats.hist_counts.sum() == df.avg_humidity.notna().sum()
+    assert stats.hist_edges[0] == df.avg_humidity.min() and stats.hist_edges[-1] == df.avg_humidity.max()
+
@@ -0,0 +1,64 @@
+# Imports
+import threading
+
+import numpy as np
+import pandas as pd
+
+from clustering import ClusterModel, fit_clusters
+
+
+def days(count, seed = 0):
+    ### Three well separated groups of days: dry and steady, average, humid and changeable
+    rng = np.random.default_rng(seed)
+    centers = np.array([[45., 3.], [65., 5.], [85., 8.]])
+    groups = rng.integers(0, 3, count)
+    features = centers[groups] + rng.normal(0, [4, .6], (count, 2))
+    return pd.DataFrame({'date': pd.date_range('2022-01-01', periods = count, freq = 'D'),
+                         'avg_humidity': features[:, 0], 'std_temp': features[:, 1]})
+
+
+# Fitting
+def test_cold_fits_number_clusters_by_humidity():
+    df = days(90)
+    labels, centroids = fit_clusters(df[['avg_humidity', 'std_temp']].to_numpy())
+
+    assert list(np.argsort(centroids[:, 0])) == [0, 1, 2]
+    assert sorted(set(labels)) == [0, 1, 2]
+
+
+def test_warm_started_refits_keep_cluster_ids():
+    df = days(120)
+    features = df[['avg_humidity', 'std_temp']].to_numpy()
+    labels, centroids = fit_clusters(features[:90])
+
+    ### Flip the IDs so numbering by humidity alone would not reproduce them
+    flipped = centroids[::-1]
+    relabelled = 2 - labels
+    refit, _ = fit_clusters(features, centroids = flipped)
+
+    np.testing.assert_array_equal(refit[:90], relabelled)
+
+
+# Model Cache
+def test_new_days_are_refit_in_the_background_and_keep_their_ids():
+    fits = []
+    landed = threading.Event()
+    model = ClusterModel(on_fit = lambda version: (fits.append(version), landed.set()))
+    df = days(120)
+    try:
+        first, held, labels = model.fit(df.iloc[:90])
+        assert first == ClusterModel.version(df.iloc[:90])
+        assert len(labels) == 90
+        landed.clear()
+
+        ### Until the refit lands, callers keep getting the last fit
+        assert model.fit(df)[0] == first
+        assert landed.wait(30)
+        version, held, refit = model.fit(df)
+
+        assert version == ClusterModel.version(df)
+        assert len(held) == 120
+        np.testing.assert_array_equal(refit[:90], labels)
+        assert fits == [first, version]
+    finally:
+        model.shutdown()
@@ -0,0 +1,68 @@
+# Imports
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import db
+import queries
+from store import TimeSeriesStore
+
+
+@pytest.fixture
+def postgres(monkeypatch):
+    '''Fake a Postgres engine and answer the batched SELECT with ``postgres.row``.'''
+    fake = SimpleNamespace(row = {}, calls = [])
+
+    def read(statement, con, parse_dates = None, **params):
+        fake.calls.append((statement, params))
+        return pd.DataFrame([fake.row])
+
+    monkeypatch.setattr(db, 'get_engine', lambda: SimpleNamespace(dialect = SimpleNamespace(name = 'postgresql')))
+    monkeypatch.setattr(queries, 'read', read)
+    return fake
+
+
+# Batch Clause
+def test_batch_clause_prefixes_parameters_with_the_request_name():
+    statement, params = db._batch_clause({
+        'readings': (queries.readings_since, {'last_seen': '2022-01-05'}),
+        'weekly': (queries.weekly, {'start': '2022-01-01'}),
+        'hum_version': (queries.hum_version, {})})
+
+    assert params == {'readings__last_seen': '2022-01-05', 'weekly__start': '2022-01-01'}
+    assert ':readings__last_seen' in statement.sql and ':weekly__start' in statement.sql
+    assert statement.sql.count('json_agg') == 3
+    assert 'AS "hum_version"' in statement.sql
+    assert 'batch' not in queries.STATEMENTS
+
+
+# Postgres
+def test_read_batch_splits_one_row_into_frames(postgres):
+    postgres.row = {'readings': '[{"date": "2022-01-05T14:15:00", "temp": 31.5}, {"date": "2022-01-05T14:30:00", "temp": 32}]',
+                    'hum_version': [{'days': 110, 'last_day': '2022-01-04'}]}
+
+    frames = db.read_batch({'readings': (queries.readings_since, {'last_seen': '2022-01-05'}),
+                            'hum_version': (queries.hum_version, {})},
+                           parse_dates = {'readings': 'date'})
+
+    assert len(postgres.calls) == 1
+    assert postgres.calls[0][1] == {'readings__last_seen': '2022-01-05'}
+    assert frames['readings']['date'].tolist() == [pd.Timestamp('2022-01-05 14:15'), pd.Timestamp('2022-01-05 14:30')]
+    assert frames['readings']['temp'].tolist() == [31.5, 32]
+    assert frames['hum_version'].to_dict('records') == [{'days': 110, 'last_day': '2022-01-04'}]
+
+
+def test_a_refresh_with_no_new_readings_leaves_the_store_alone(postgres):
+    postgres.row = {'readings': '[]'}
+    store = TimeSeriesStore()
+    dates = np.array(['2022-01-05T14:15', '2022-01-05T14:30'], dtype = 'datetime64[ns]')
+    store.append(dates, np.array([31.5, 32.]))
+    version = store.version
+
+    frames = db.read_batch({'readings': (queries.readings_since, {'last_seen': '2022-01-05'})},
+                           parse_dates = {'readings': 'date'})
+
+    assert store.apply(frames['readings']) == version
+    assert len(store) == 2
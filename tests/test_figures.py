@@ -0,0 +1,60 @@
+# Imports
+import base64
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from figures import FigureCache, encode, typed_array
+
+
+def decode(array):
+    return np.frombuffer(base64.b64decode(array['bdata']), dtype = '<' + array['dtype'])
+
+
+# Typed Arrays
+def test_only_long_floats_become_typed_arrays():
+    dates = pd.date_range('2022-01-05', periods = 4, freq = '15min')
+    averages = np.array([31.123456, 32.654321, np.nan, 30.5])
+    fig = go.Figure(go.Scatter(x = dates, y = averages, customdata = dates.to_numpy(dtype = 'datetime64[D]')))
+    fig.add_trace(go.Scatter(x = dates, y = np.array([31.5, 32.25, np.nan, 30.])))
+    fig.add_trace(go.Histogram(x = np.array([1, 2, 2, 3])))
+
+    data = encode(fig)['data']
+
+    ### Averages are sent as float32, NaN included
+    assert data[0]['y']['dtype'] == 'f4'
+    np.testing.assert_allclose(decode(data[0]['y']), averages.astype('float32'))
+    ### Readings with two decimals and integer counts stay JSON, NaN as null
+    assert data[1]['y'] == [31.5, 32.25, None, 30.]
+    assert data[2]['x'] == [1, 2, 2, 3]
+
+
+def test_dates_stay_json_strings():
+    dates = pd.date_range('2022-01-05', periods = 2, freq = 'D')
+    fig = go.Figure(go.Scatter(x = dates, y = [1., 2.], customdata = dates.to_numpy(dtype = 'datetime64[D]')))
+
+    trace = encode(fig)['data'][0]
+
+    assert trace['x'] == ['2022-01-05T00:00:00', '2022-01-06T00:00:00']
+    assert trace['customdata'] == ['2022-01-05', '2022-01-06']
+
+
+def test_typed_array_round_trips():
+    values = np.array([1.25, -3.5, 1e6])
+    assert decode(typed_array(values, dtype = 'f8')).tolist() == values.tolist()
+
+
+# Figure Cache
+def test_figures_are_built_once_per_version():
+    builds = []
+    cache = FigureCache()
+
+    def build():
+        builds.append(1)
+        return go.Figure(go.Scatter(x = [1, 2], y = [3., 4.]))
+
+    first = cache.get('daily', [10, '2022-01-05'], build)
+    assert cache.get('daily', (10, '2022-01-05'), build) is first
+    cache.get('daily', [11, '2022-01-05 00:15'], build)
+    assert len(builds) == 2
@@ -0,0 +1,84 @@
+# Imports
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import queries
+from ingest import batches, parse, _copy, _frame
+
+
+# Parsing
+def test_json_lines_skip_blank_lines():
+    lines = ['{"date": "2022-01-05 14:15:00", "temp": 31.5}\n', '\n', '{"date": "2022-01-05 14:30:00", "temp": "32"}\n']
+    assert list(parse(lines, 'application/x-ndjson')) == [('2022-01-05 14:15:00', 31.5), ('2022-01-05 14:30:00', '32')]
+
+
+def test_csv_needs_a_date_and_temp_header():
+    lines = ['temp,date,sensor\n', '31.5,2022-01-05 14:15:00,basement\n']
+    assert list(parse(lines, 'text/csv')) == [('2022-01-05 14:15:00', '31.5')]
+
+    with pytest.raises(ValueError, match = 'header'):
+        list(parse(['2022-01-05 14:15:00,31.5\n'], 'text/csv'))
+
+
+@pytest.mark.parametrize('line', ['not json', '{"date": "2022-01-05"}', '[1, 2]'])
+def test_bad_json_lines_name_the_line(line):
+    with pytest.raises(ValueError, match = 'line 2'):
+        list(parse(['{"date": "2022-01-05", "temp": 1}', line], 'application/jsonl'))
+
+
+def test_unsupported_content_types_are_refused():
+    with pytest.raises(ValueError, match = 'unsupported'):
+        list(parse(['date,temp'], 'text/plain'))
+
+
+# Batching
+def test_batches_are_deduplicated_and_sorted():
+    pairs = [('2022-01-05 14:30', 2), ('2022-01-05 14:15', 1), ('2022-01-05 14:30', 3)]
+    df = _frame(pairs)
+
+    assert df['date'].tolist() == [pd.Timestamp('2022-01-05 14:15'), pd.Timestamp('2022-01-05 14:30')]
+    ### The last copy of a repeated timestamp wins
+    assert df['temp'].tolist() == [1, 3]
+
+
+def test_batches_split_at_the_batch_size():
+    pairs = [('2022-01-05 00:{:02d}'.format(minute), minute) for minute in range(5)]
+    assert [len(batch) for batch in batches(pairs, size = 2)] == [2, 2, 1]
+
+
+def test_offsets_are_converted_to_local_time():
+    df = _frame([('2022-01-05T19:15:00Z', 1), ('2022-07-05T19:15:00+00:00', 2)])
+    assert df['date'].dt.tz is None
+    assert df['date'].tolist() == [pd.Timestamp('2022-01-05 14:15'), pd.Timestamp('2022-07-05 15:15')]
+
+
+def test_mixed_offsets_share_one_zone():
+    df = _frame([('2022-01-05T19:15:00Z', 1), ('2022-01-05T15:30:00-05:00', 2)])
+    assert df['date'].tolist() == [pd.Timestamp('2022-01-05 14:15'), pd.Timestamp('2022-01-05 15:30')]
+
+
+@pytest.mark.parametrize('pairs', [[('yesterday-ish', 1)], [('2022-01-05', 'warm')], [(None, 1)], [('2022-01-05', None)]])
+def test_unreadable_readings_are_rejected(pairs):
+    with pytest.raises(ValueError):
+        _frame(pairs)
+
+
+# Writing
+def test_postgres_batches_lock_and_merge_without_schema_changes():
+    executed = []
+    cursor = SimpleNamespace(execute = executed.append,
+                             copy_expert = lambda sql, buffer: executed.append(buffer.getvalue()),
+                             fetchall = lambda: [('2022-01-05 14:30:00', 3.0), ('2022-01-05 14:15:00', 1.0)])
+    connection = SimpleNamespace(cursor = lambda: cursor, commit = lambda: executed.append('COMMIT'),
+                                 rollback = lambda: None, close = lambda: None)
+    engine = SimpleNamespace(raw_connection = lambda: connection)
+
+    inserted = _copy(engine, _frame([('2022-01-05 14:15', 1), ('2022-01-05 14:30', 3)]))
+
+    assert executed[:2] == [queries.ingest_lock, queries.ingest_buffer]
+    assert executed[2] == '2022-01-05 14:15:00.000000,1\n2022-01-05 14:30:00.000000,3\n'
+    assert executed[3:] == [queries.ingest_merge, 'COMMIT']
+    assert not any('INDEX' in sql for sql in executed)
+    assert inserted['date'].tolist() == [pd.Timestamp('2022-01-05 14:15'), pd.Timestamp('2022-01-05 14:30')]
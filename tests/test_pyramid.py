@@ -0,0 +1,72 @@
+# Imports
+import numpy as np
+import pandas as pd
+
+from pyramid import RollupPyramid
+from store import TimeSeriesStore
+
+
+def filled(days = 60, seed = 1):
+    rng = np.random.default_rng(seed)
+    dates = (np.datetime64('2022-01-03T00:00') + np.arange(days * 96) * np.timedelta64(15, 'm')).astype('datetime64[ns]')
+    temps = np.round(40 + 10 * rng.standard_normal(len(dates)), 2)
+
+    store = TimeSeriesStore(capacity = 16)
+    pyramid = RollupPyramid(store)
+    for start in range(0, len(dates), 500):
+        store.append(dates[start:start + 500], temps[start:start + 500])
+    return store, pyramid, pd.DataFrame({'date': dates, 'temp': temps})
+
+
+def reference(df, key):
+    grouped = df.groupby(key)['temp']
+    return pd.DataFrame({'date': grouped.mean().index, 'temp': grouped.mean().to_numpy(),
+                         'min': grouped.min().to_numpy(), 'max': grouped.max().to_numpy()})
+
+
+# Tiers
+def test_tiers_match_pandas_groupby():
+    store, pyramid, df = filled()
+    first, last = store.bounds()
+    keys = {'hourly': df['date'].dt.floor('H'),
+            'daily': df['date'].dt.floor('D'),
+            ### Weeks start on Monday
+            'weekly': df['date'].dt.to_period('W-SUN').dt.start_time}
+
+    for tier in pyramid.tiers:
+        window = tier.window(first, last)
+        expected = reference(df, keys[tier.name])
+        np.testing.assert_array_equal(window['date'].to_numpy(), expected['date'].to_numpy())
+        for column in ('temp', 'min', 'max'):
+            np.testing.assert_allclose(window[column], expected[column])
+
+
+def test_query_picks_the_finest_tier_that_fits():
+    store, pyramid, df = filled()
+
+    tier, raw = pyramid.query('2022-01-10', '2022-01-11', width = 1000)
+    assert tier == 'raw'
+    assert len(raw) == 97
+
+    ### 60 days is 1440 hours and 60 days; a budget of 200 points only fits the daily tier
+    tier, daily = pyramid.query(width = 100)
+    assert tier == 'daily'
+    assert len(daily) == 60
+
+    tier, weekly = pyramid.query(width = 1)
+    assert tier == 'weekly'
+
+
+def test_a_zoomed_window_includes_the_bucket_it_starts_in():
+    store, pyramid, df = filled()
+    tier, weekly = pyramid.query('2022-01-10 12:00', '2022-01-20', width = 5)
+
+    assert tier == 'weekly'
+    assert weekly['date'].iloc[0] == pd.Timestamp('2022-01-10')
+
+
+def test_reset_with_the_store():
+    store, pyramid, df = filled(days = 3)
+    store.discard()
+
+    assert all(len(tier) == 0 for tier in pyramid.tiers)
@@ -0,0 +1,65 @@
+# Imports
+import numpy as np
+import pandas as pd
+
+from rollups import RollupEngine
+
+
+def readings(days = 30, seed = 0):
+    rng = np.random.default_rng(seed)
+    dates = np.datetime64('2022-01-01T00:00') + np.arange(days * 96) * np.timedelta64(15, 'm')
+    temps = np.round(40 + 10 * rng.standard_normal(len(dates)), 2)
+    return dates.astype('datetime64[ns]'), temps
+
+
+def fed(dates, temps, chunk = 37):
+    ### Uneven chunks, so days get split across batches
+    engine = RollupEngine()
+    for start in range(0, len(dates), chunk):
+        engine.extend(dates[start:start + chunk], temps[start:start + chunk])
+    return engine
+
+
+def reference(dates, temps):
+    df = pd.DataFrame({'date': dates, 'temp': temps})
+    return df.groupby(df['date'].dt.floor('D'))['temp']
+
+
+# Daily Rollups
+def test_daily_averages_and_moving_average_match_pandas():
+    dates, temps = readings()
+    daily = fed(dates, temps).daily()
+    expected = reference(dates, temps).mean()
+
+    np.testing.assert_array_equal(daily['date'].to_numpy(), expected.index.to_numpy())
+    np.testing.assert_allclose(daily['temp'], expected.to_numpy())
+    np.testing.assert_allclose(daily['moving_avg'], expected.rolling(10, min_periods = 1).mean().to_numpy())
+
+
+def test_daily_highs_lows_and_std_match_pandas():
+    dates, temps = readings()
+    engine = fed(dates, temps)
+    grouped = reference(dates, temps)
+
+    np.testing.assert_allclose(engine.daily_hl()['max'], grouped.max().to_numpy())
+    np.testing.assert_allclose(engine.daily_hl()['min'], grouped.min().to_numpy())
+    np.testing.assert_allclose(engine.daily_std()['std_temp'], grouped.std().to_numpy())
+
+
+def test_records_track_the_extremes():
+    dates, temps = readings()
+    engine = fed(dates, temps)
+
+    assert engine.record_low()['temp'][0] == temps.min()
+    assert engine.record_low()['date'][0] == pd.Timestamp(dates[temps.argmin()])
+    assert engine.record_high()['temp'][0] == temps.max()
+
+
+def test_reset_forgets_everything():
+    dates, temps = readings(days = 3)
+    engine = fed(dates, temps)
+    engine.reset()
+
+    assert len(engine) == 0
+    assert engine.daily().empty
+    assert engine.record_high().empty
@@ -0,0 +1,101 @@
+# Imports
+import threading
+import time
+
+import pytest
+
+from snapshot import SnapshotCache
+
+
+# Single Flight
+def test_concurrent_callers_share_one_fetch():
+    calls = []
+    release = threading.Event()
+
+    def load():
+        calls.append(1)
+        release.wait(5)
+        return 'value'
+
+    cache = SnapshotCache({'data': load})
+    results = []
+    threads = [threading.Thread(target = lambda: results.append(cache.get('data'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+
+    ### Let every thread reach the cache before the one fetch finishes
+    time.sleep(.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == ['value'] * 8
+
+
+def test_waiters_see_the_leaders_error_and_the_next_call_retries():
+    attempts = []
+    release = threading.Event()
+
+    def load():
+        attempts.append(1)
+        if len(attempts) == 1:
+            release.wait(5)
+            raise RuntimeError('database down')
+        return 'recovered'
+
+    cache = SnapshotCache({'data': load})
+    errors = []
+
+    def get():
+        try:
+            cache.get('data')
+        except RuntimeError as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target = get) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(errors) == 4
+    assert cache.get('data') == 'recovered'
+    assert len(attempts) == 2
+
+
+# Freshness
+def test_values_are_reused_until_the_ttl_passes_or_they_are_invalidated():
+    calls = []
+    cache = SnapshotCache({'data': lambda: calls.append(1) or len(calls)}, ttl = 60)
+
+    assert cache.get('data') == 1
+    assert cache.get('data') == 1
+
+    cache.invalidate('data')
+    assert cache.get('data') == 2
+
+    cache.ttl = 0
+    assert cache.get('data') == 3
+
+
+def test_dependents_rebuild_after_their_dependency_is_refetched():
+    source = {'rows': 1}
+    cache = SnapshotCache({'base': lambda: source['rows']})
+    cache.register('derived', lambda: cache.get('base') * 10, depends = ['base'])
+
+    assert cache.get('derived') == 10
+
+    source['rows'] = 2
+    cache.invalidate('base')
+    assert cache.get('derived') == 20
+
+    cache.put('base', 3)
+    assert cache.get('derived') == 30
+
+
+def test_unknown_names_raise():
+    with pytest.raises(KeyError):
+        SnapshotCache({}).get('missing')
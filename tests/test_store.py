@@ -0,0 +1,63 @@
+# Imports
+import uuid
+
+import numpy as np
+
+from store import TimeSeriesStore
+
+
+def readings(start, count):
+    dates = (np.datetime64(start) + np.arange(count) * np.timedelta64(15, 'm')).astype('datetime64[ns]')
+    return dates, np.arange(count, dtype = 'float64')
+
+
+# Shared Snapshot
+def test_a_second_store_adopts_the_snapshot_and_keeps_its_own_tail():
+    name = 'test-' + uuid.uuid4().hex
+    writer, reader = TimeSeriesStore(snapshot = name), TimeSeriesStore(snapshot = name)
+    dates, temps = readings('2022-01-01', 10)
+
+    for store in (writer, reader):
+        store.next_query()
+    reader.append(dates, temps)
+    writer.append(dates[:8], temps[:8])
+    writer._write_snapshot()
+
+    ### A view taken before adoption must not change underneath its reader
+    held_dates, held_temps = reader.segments()[1]
+    before = held_dates.copy()
+
+    statement, params = reader.next_query()
+    assert [len(segment[0]) for segment in reader.segments()] == [8, 2]
+    np.testing.assert_array_equal(held_dates, before)
+    np.testing.assert_array_equal(reader.window()[0], dates)
+    assert params['last_seen'] == dates[-1].astype('datetime64[us]').item()
+
+
+def test_discard_makes_other_stores_start_over():
+    name = 'test-' + uuid.uuid4().hex
+    first, second = TimeSeriesStore(snapshot = name), TimeSeriesStore(snapshot = name)
+    dates, temps = readings('2022-01-01', 10)
+    for store in (first, second):
+        store.next_query()
+        store.append(dates, temps)
+
+    resets = []
+    second.subscribe(lambda dates, temps: None, reset = lambda: resets.append(1))
+    first.discard()
+
+    statement, params = second.next_query()
+    assert len(second) == 0
+    assert resets == [1]
+    assert params == {}
+
+
+def test_apply_drops_rows_already_held():
+    import pandas as pd
+
+    store = TimeSeriesStore()
+    dates, temps = readings('2022-01-01', 10)
+    store.apply(pd.DataFrame({'date': dates[:6], 'temp': temps[:6]}))
+    store.apply(pd.DataFrame({'date': dates[3:], 'temp': temps[3:]}))
+
+    np.testing.assert_array_equal(store.window()[0], dates)